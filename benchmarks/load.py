@@ -0,0 +1,226 @@
+"""Drive the API hot paths with concurrent clients and report latency and queries per request.
+
+Run `benchmarks/seed.py` first. Requests go through an in-process test client by
+default, or to a running server with `--url`. The statement count of each request
+is read from the `Server-Timing` header set by the query instrumentation::
+
+    python benchmarks/load.py --clients 8 --duration 30 --output results.json
+    python benchmarks/load.py --baseline results.json   # exit 1 on regression
+
+A request mix weight of 0 disables an endpoint, e.g. `--mix orders=5 order=0`.
+"""
+import json
+import random
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from threading import Thread
+
+DEFAULT_MIX = {
+    'orders': 4,
+    'products': 4,
+    'dashboard_metrics': 2,
+    'order': 2,
+    'product_import': 1
+}
+STATEMENTS = re.compile(r'desc="(\d+) statements"')
+
+arg_parser = ArgumentParser(description='Load test the API')
+arg_parser.add_argument('--url', help='Base URL of a running server, e.g. http://localhost:8080')
+arg_parser.add_argument('-c', '--clients', help='Concurrent clients', type=int, default=8)
+arg_parser.add_argument('-t', '--duration', help='Seconds to run', type=float, default=30)
+arg_parser.add_argument('-d', '--days', help='Days of seeded history', type=int, default=90)
+arg_parser.add_argument('-m', '--mix', help='Request weights as name=weight', nargs='*', default=[])
+arg_parser.add_argument('-u', '--username', default='bench')
+arg_parser.add_argument('--password', default='bench')
+arg_parser.add_argument('--seed', help='Random seed', type=int, default=42)
+arg_parser.add_argument('-o', '--output', help='Write the report to this JSON file')
+arg_parser.add_argument('-b', '--baseline', help='Compare against a previous report')
+arg_parser.add_argument('--tolerance', help='Allowed relative regression', type=float, default=0.2)
+args = arg_parser.parse_args()
+
+mix = {**DEFAULT_MIX, **{name: float(weight) for name, weight in (item.split('=') for item in args.mix)}}
+mix = {name: weight for name, weight in mix.items() if weight > 0}
+
+
+class HttpClient:
+    """Client of a running server"""
+
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, body=None):
+        response = self.session.request(method, f'{self.url}{path}', json=body)
+        return response.status_code, response.headers, response.content
+
+
+class AppClient:
+    """In-process client of the Flask app, no server needed"""
+
+    app = None
+
+    def __init__(self):
+        if AppClient.app is None:
+            from src import create_app
+            AppClient.app = create_app()
+        self.client = AppClient.app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.headers, response.get_data()
+
+
+def make_client():
+    client = HttpClient(args.url) if args.url else AppClient()
+    status, _, _ = client.request('POST', '/api/v1/auth/login', {
+        'username': args.username, 'password': args.password
+    })
+    if status != 200:
+        raise SystemExit(f'Login as {args.username} failed with {status}, run benchmarks/seed.py first')
+    return client
+
+
+class Scenarios:
+    """Builds the requests of the mix from the seeded data"""
+
+    def __init__(self, client, rng):
+        self.rng = rng
+        self.last_day = date.today()
+        _, _, body = client.request('GET', '/api/v1/products?limit=1000')
+        self.product_ids = [product['id'] for product in json.loads(body)]
+        if not self.product_ids:
+            raise SystemExit('No product found, run benchmarks/seed.py first')
+
+    def sample_products(self, count):
+        # A small seed may have fewer products than a request uses
+        return self.rng.sample(self.product_ids, min(count, len(self.product_ids)))
+
+    def date_range(self, max_days=30):
+        end = self.last_day - timedelta(days=self.rng.randrange(args.days))
+        return end - timedelta(days=self.rng.randrange(max_days)), end
+
+    def orders(self):
+        start, end = self.date_range()
+        return 'GET', f'/api/v1/orders?start_date={start}&end_date={end}&limit=100', None
+
+    def products(self):
+        return 'GET', '/api/v1/products?limit=500', None
+
+    def dashboard_metrics(self):
+        start, end = self.date_range(90)
+        return 'GET', f'/api/v1/dashboard/metrics?start_date={start}&end_date={end}', None
+
+    def order(self):
+        products = self.sample_products(3)
+        return 'POST', '/api/v1/order', {
+            'customer': {'name': f'bench customer {self.rng.randrange(1, 5000)}'},
+            'ordered_date': self.date_range(1)[1].isoformat(),
+            'order_lines': [
+                {'product_id': product_id, 'quantity': 1, 'sale_price': 20000, 'discount': 0}
+                for product_id in products
+            ]
+        }
+
+    def product_import(self):
+        products = self.sample_products(10)
+        return 'POST', '/api/v1/product/import', {
+            'import_date': self.date_range(1)[1].isoformat(),
+            'other_expenses': 0,
+            'import_lines': [
+                {'productId': product_id, 'quantity': 100, 'unit_price': 10000}
+                for product_id in products
+            ]
+        }
+
+
+def run_client(index, deadline, samples):
+    rng = random.Random(args.seed + index)
+    client = make_client()
+    scenarios = Scenarios(client, rng)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, body = getattr(scenarios, name)()
+        started_at = time.perf_counter()
+        status, headers, content = client.request(method, path, body)
+        elapsed = time.perf_counter() - started_at
+        match = STATEMENTS.search(headers.get('Server-Timing', ''))
+        samples.append((name, elapsed, status, len(content), int(match.group(1)) if match else None))
+
+
+def percentile(values, q):
+    index = min(len(values) - 1, max(0, round(q * len(values)) - 1))
+    return values[index]
+
+
+def summarize(samples, elapsed) -> dict:
+    report = {}
+    for name in sorted({sample[0] for sample in samples}) + ['all']:
+        selected = [sample for sample in samples if name == 'all' or sample[0] == name]
+        latencies = sorted(sample[1] * 1000 for sample in selected)
+        statements = [sample[4] for sample in selected if sample[4] is not None]
+        report[name] = {
+            'requests': len(selected),
+            'errors': sum(sample[2] >= 400 for sample in selected),
+            'requests_per_second': round(len(selected) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'avg_bytes': round(sum(sample[3] for sample in selected) / len(selected)),
+            'statements_per_request': round(sum(statements) / len(statements), 2) if statements else None
+        }
+    return report
+
+
+def compare(report, baseline) -> list:
+    """List the endpoints that got slower, lost throughput or run more statements"""
+    regressions = []
+    for name, current in report.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + args.tolerance):
+            regressions.append(f'{name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+        if current['requests_per_second'] < previous['requests_per_second'] * (1 - args.tolerance):
+            regressions.append(
+                f'{name}: {previous["requests_per_second"]} -> {current["requests_per_second"]} req/s'
+            )
+        if (current['statements_per_request'] or 0) > (previous['statements_per_request'] or 0) + 0.5:
+            regressions.append(
+                f'{name}: {previous["statements_per_request"]} -> '
+                f'{current["statements_per_request"]} statements per request'
+            )
+    return regressions
+
+
+# Fail fast on a bad setup, before any thread starts
+make_client()
+samples = []
+started_at = time.perf_counter()
+deadline = started_at + args.duration
+threads = [Thread(target=run_client, args=(index, deadline, samples)) for index in range(args.clients)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+if not samples:
+    raise SystemExit('No request was sent')
+
+report = summarize(samples, time.perf_counter() - started_at)
+print(json.dumps(report, indent=2))
+if args.output:
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+if args.baseline:
+    with open(args.baseline) as file:
+        regressions = compare(report, json.load(file))
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    sys.exit(1 if regressions else 0)
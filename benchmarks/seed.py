@@ -0,0 +1,149 @@
+"""Seed the configured database with synthetic data for the load test.
+
+Products, customers, orders and imports are generated server side with
+`generate_series`, in batches, so seeding millions of lines only takes minutes.
+Every synthetic product and customer is prefixed with `bench`, and the orders
+and imports belong to the benchmark user. The rollups are rebuilt at the end::
+
+    python benchmarks/seed.py --lines 1000000 --days 365
+
+Only point this at a database made for benchmarking.
+"""
+import json
+import time
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from logging import INFO, basicConfig, getLogger
+
+from src.repository import PostgresRepository, UnitOfWork
+from src.services.rollup import RollupService
+from src.services.user import UserService
+
+arg_parser = ArgumentParser(description='Seed synthetic benchmark data')
+arg_parser.add_argument('-l', '--lines', help='Number of order lines', type=int, default=10000)
+arg_parser.add_argument('--import-lines', help='Number of import lines, a tenth of --lines by default',
+                        type=int)
+arg_parser.add_argument('-p', '--products', help='Number of products', type=int, default=2000)
+arg_parser.add_argument('-c', '--customers', help='Number of customers', type=int, default=5000)
+arg_parser.add_argument('-d', '--days', help='Days of history, ending today', type=int, default=90)
+arg_parser.add_argument('--lines-per-order', type=int, default=3)
+arg_parser.add_argument('--lines-per-import', type=int, default=20)
+arg_parser.add_argument('-b', '--batch-size', help='Orders or imports inserted per statement',
+                        type=int, default=100000)
+arg_parser.add_argument('-u', '--username', default='bench')
+arg_parser.add_argument('--password', default='bench')
+args = arg_parser.parse_args()
+
+basicConfig(level=INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = getLogger('benchmarks.seed')
+repo = PostgresRepository()
+first_day = date.today() - timedelta(days=args.days - 1)
+
+
+def seed_user() -> int:
+    user_service = UserService()
+    if user := user_service.get_user_by_username(args.username):
+        return user.id
+    return user_service.create_user(args.username, args.password).id
+
+
+def seed_products():
+    repo.execute("""
+        INSERT INTO product (sku, name, unit_price, sale_price, description, image_url, stock_quantity)
+        SELECT 'bench-' || i, 'Bench product ' || i, 10000 + (i % 50) * 1000,
+               15000 + (i % 50) * 1500, 'Synthetic product', 'https://example.com/bench.png', 1000000
+        FROM generate_series(1, :count) AS i
+        ON CONFLICT DO NOTHING
+    """, {'count': args.products})
+    repo.execute("""
+        INSERT INTO customer (name)
+        SELECT 'bench customer ' || i FROM generate_series(1, :count) AS i
+        ON CONFLICT DO NOTHING
+    """, {'count': args.customers})
+
+
+def seed_orders(user_id: int, orders: int):
+    """Insert `orders` orders spread over the days, each with distinct products"""
+    repo.execute("""
+        WITH products AS (
+            SELECT array_agg(id ORDER BY id) AS ids, array_agg(sale_price ORDER BY id) AS prices,
+                   array_agg(COALESCE(average_cost, unit_price) ORDER BY id) AS costs
+            FROM product WHERE sku LIKE 'bench-%'
+        ), customers AS (
+            SELECT array_agg(id ORDER BY id) AS ids
+            FROM customer WHERE name LIKE 'bench customer %'
+        ), new_orders AS (
+            INSERT INTO "order" (customer_id, created_by, order_at, status)
+            SELECT c.ids[1 + (g * 7919) % :customers], :user_id, :first_day + (g % :days), 1
+            FROM generate_series(1, :orders) AS g, customers c
+            RETURNING id
+        ), new_lines AS (
+            SELECT o.id AS order_id, 1 + (o.id * 31 + j) % :products AS position,
+                   1 + (o.id + j) % 5 AS quantity
+            FROM new_orders o, generate_series(0, :lines_per_order - 1) AS j
+        )
+        INSERT INTO order_line (order_id, product_id, quantity, sale_price, discount,
+                                net_total_price, gross_total_price, unit_cost)
+        SELECT l.order_id, p.ids[l.position], l.quantity, p.prices[l.position], 0,
+               p.prices[l.position] * l.quantity, p.prices[l.position] * l.quantity, p.costs[l.position]
+        FROM new_lines l, products p
+    """, {
+        'user_id': user_id, 'first_day': first_day, 'days': args.days, 'orders': orders,
+        'customers': args.customers, 'products': args.products,
+        'lines_per_order': min(args.lines_per_order, args.products)
+    })
+
+
+def seed_imports(user_id: int, importers: int):
+    repo.execute("""
+        WITH products AS (
+            SELECT array_agg(id ORDER BY id) AS ids, array_agg(unit_price ORDER BY id) AS prices
+            FROM product WHERE sku LIKE 'bench-%'
+        ), new_importers AS (
+            INSERT INTO importer (imported_at, imported_by, other_expenses, status)
+            SELECT :first_day + (g % :days), :user_id, 0, 1
+            FROM generate_series(1, :importers) AS g
+            RETURNING id
+        ), new_lines AS (
+            SELECT i.id AS importer_id, 1 + (i.id * 17 + j) % :products AS position
+            FROM new_importers i, generate_series(0, :lines_per_import - 1) AS j
+        )
+        INSERT INTO import_line (importer_id, product_id, quantity, unit_price, total_price)
+        SELECT l.importer_id, p.ids[l.position], 50, p.prices[l.position], p.prices[l.position] * 50
+        FROM new_lines l, products p
+    """, {
+        'user_id': user_id, 'first_day': first_day, 'days': args.days, 'importers': importers,
+        'products': args.products, 'lines_per_import': min(args.lines_per_import, args.products)
+    })
+
+
+def seed_in_batches(seed, user_id: int, total: int, label: str):
+    for offset in range(0, total, args.batch_size):
+        with UnitOfWork():
+            seed(user_id, min(args.batch_size, total - offset))
+        logger.info(f'{min(offset + args.batch_size, total)} / {total} {label} seeded')
+
+
+started_at = time.perf_counter()
+with UnitOfWork():
+    seed_products()
+    user_id = seed_user()
+
+orders = -(-args.lines // args.lines_per_order)
+importers = -(-(args.import_lines or args.lines // 10) // args.lines_per_import)
+seed_in_batches(seed_orders, user_id, orders, 'orders')
+seed_in_batches(seed_imports, user_id, importers, 'importers')
+
+rollups = RollupService().rebuild()
+repo.execute('ANALYZE')
+repo.commit()
+print(json.dumps({
+    'orders': orders,
+    'order_lines': orders * args.lines_per_order,
+    'importers': importers,
+    'import_lines': importers * args.lines_per_import,
+    'first_day': first_day.isoformat(),
+    'days': args.days,
+    **rollups,
+    'elapsed_seconds': round(time.perf_counter() - started_at, 1)
+}, indent=2))
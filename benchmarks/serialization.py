@@ -0,0 +1,70 @@
+"""Compare serializing products from ORM entities against the column projection path.
+
+Synthetic products are inserted in a transaction that is rolled back at the end, so
+the benchmark can run against any database without leaving data behind::
+
+    python benchmarks/serialization.py -n 50000 -r 5
+"""
+import json
+import time
+from argparse import ArgumentParser
+
+from src.models.product import Product
+from src.repository import PostgresRepository
+
+arg_parser = ArgumentParser(description='Benchmark listing serialization')
+arg_parser.add_argument('-n', '--rows', help='Number of synthetic products', type=int, default=20000)
+arg_parser.add_argument('-r', '--repeat', help='Runs per path, the best run is kept', type=int, default=5)
+args = arg_parser.parse_args()
+
+
+def orm_to_dict(repo):
+    """The listing path before projections: ORM entities, `to_dict`, then int prices"""
+    products = []
+    for product in repo.find(Product, order_by=Product.id):
+        product_dict = product.to_dict()
+        product_dict['unit_price'] = int(product.unit_price)
+        product_dict['sale_price'] = int(product.sale_price)
+        products.append(product_dict)
+    repo.session.expunge_all()
+    return products
+
+
+def projection(repo):
+    return repo.find_projection(Product, order_by=Product.id)
+
+
+def measure(repo, path):
+    best = None
+    for _ in range(args.repeat):
+        started_at = time.perf_counter()
+        rows = path(repo)
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best
+
+
+repo = PostgresRepository()
+try:
+    repo.execute("""
+        INSERT INTO product (sku, name, unit_price, sale_price, description, image_url, stock_quantity)
+        SELECT 'BENCH-' || i, 'Benchmark product ' || i, 1000 + i % 500, 2000 + i % 500,
+               'Synthetic product', 'https://example.com/' || i || '.png', i % 100
+        FROM generate_series(1, :rows) AS i
+    """, {'rows': args.rows})
+
+    baseline, baseline_seconds = measure(repo, orm_to_dict)
+    projected, projected_seconds = measure(repo, projection)
+    if json.dumps(baseline, default=str) != json.dumps(projected, default=str):
+        raise SystemExit('The two paths returned different products')
+
+    print(json.dumps({
+        'rows': len(projected),
+        'orm_to_dict_seconds': round(baseline_seconds, 4),
+        'projection_seconds': round(projected_seconds, 4),
+        'orm_to_dict_rows_per_second': round(len(baseline) / baseline_seconds),
+        'projection_rows_per_second': round(len(projected) / projected_seconds),
+        'speedup': round(baseline_seconds / projected_seconds, 2)
+    }, indent=2))
+finally:
+    repo.rollback()
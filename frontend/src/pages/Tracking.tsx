@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   Typography,
@@ -20,6 +20,12 @@ import {
 import { customerAPI, authAPI } from '../services/api';
 import axios from 'axios';
 
+// crypto.randomUUID is only available in secure contexts
+const newIdempotencyKey = () =>
+  typeof crypto.randomUUID === 'function'
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+
 interface Product {
   id: number;
   name: string;
@@ -48,6 +54,9 @@ export default function Tracking() {
   const [totalOrderPrice, setTotalOrderPrice] = useState<number>(0);
   const [newCustomerName, setNewCustomerName] = useState<string>('');
 
+  // One key per order: a retried submit reuses it, editing the form starts a new order
+  const idempotencyKey = useRef<string | null>(null);
+
   // Snackbar state
   const [snackbarOpen, setSnackbarOpen] = useState(false);
   const [snackbarMessage, setSnackbarMessage] = useState('');
@@ -57,6 +66,10 @@ export default function Tracking() {
     calculateTotalOrderPrice();
   }, [products]);
 
+  useEffect(() => {
+    idempotencyKey.current = null;
+  }, [orderDate, selectedCustomer, newCustomerName, products]);
+
   useEffect(() => {
     const fetchCustomers = async () => {
       try {
@@ -153,8 +166,12 @@ export default function Tracking() {
       order_lines: orderLines,
     };
 
+    idempotencyKey.current ??= newIdempotencyKey();
+
     try {
-      const response = await axios.post('/api/v1/order', orderData);
+      const response = await axios.post('/api/v1/order', orderData, {
+        headers: { 'Idempotency-Key': idempotencyKey.current },
+      });
       if (response.data.success) {
         setSnackbarMessage(response.data.message);
         setSnackbarSeverity('success');
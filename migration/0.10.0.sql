@@ -0,0 +1,37 @@
+-- 0.10.0
+CREATE TABLE IF NOT EXISTS public.customer_daily_rollup (
+    day           DATE            NOT NULL,
+    customer_id   INTEGER         NOT NULL,
+    orders        INTEGER         NOT NULL DEFAULT 0,
+    quantity      INTEGER         NOT NULL DEFAULT 0,
+    revenue       DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    discount      DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    cost          DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    profit        DECIMAL(14, 2)  GENERATED ALWAYS AS (revenue - cost - discount) STORED,
+    created_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (day, customer_id)
+);
+COMMENT ON TABLE public.customer_daily_rollup IS 'Daily sales per customer, maintained when orders are committed';
+
+-- Backfill the rollup from existing orders
+INSERT INTO public.customer_daily_rollup (day, customer_id, orders, quantity, revenue, discount, cost)
+SELECT o.order_at, o.customer_id, COUNT(DISTINCT o.id), SUM(ol.quantity),
+       SUM(ol.quantity * ol.sale_price), SUM(ol.discount), SUM(ol.quantity * ol.unit_cost)
+FROM public.order_line ol
+JOIN public.order o ON o.id = ol.order_id
+GROUP BY o.order_at, o.customer_id;
+
+CREATE TABLE IF NOT EXISTS public.top_daily_sketch (
+    dimension     VARCHAR(16)     NOT NULL,
+    metric        VARCHAR(16)     NOT NULL,
+    day           DATE            NOT NULL,
+    item_id       INTEGER         NOT NULL,
+    value         DECIMAL(14, 2)  NOT NULL,
+    floor         DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    created_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (dimension, metric, day, item_id)
+);
+COMMENT ON TABLE public.top_daily_sketch IS 'Heaviest products and customers of each day by quantity and revenue. The `floor` field bounds the value of any item of that day not kept';
+CREATE INDEX IF NOT EXISTS idx_top_daily_sketch_day ON public.top_daily_sketch (day);
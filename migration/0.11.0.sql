@@ -0,0 +1,8 @@
+-- 0.11.0
+CREATE TABLE IF NOT EXISTS public.rollup_version (
+    day           DATE            PRIMARY KEY,
+    version       BIGINT          NOT NULL DEFAULT 1,
+    created_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMP       NOT NULL DEFAULT NOW()
+);
+COMMENT ON TABLE public.rollup_version IS 'Bumped with the rollups of a day, so every process can tell its cached dashboard metrics of the day are stale';
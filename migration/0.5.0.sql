@@ -0,0 +1,40 @@
+-- 0.5.0
+CREATE TABLE IF NOT EXISTS public.sales_daily_rollup (
+    day           DATE            NOT NULL,
+    product_id    INTEGER         NOT NULL,
+    quantity      INTEGER         NOT NULL DEFAULT 0,
+    revenue       DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    discount      DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    cost          DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    profit        DECIMAL(14, 2)  GENERATED ALWAYS AS (revenue - cost - discount) STORED,
+    created_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (day, product_id)
+);
+COMMENT ON TABLE public.sales_daily_rollup IS 'Daily sales per product, maintained when orders are committed';
+
+CREATE TABLE IF NOT EXISTS public.import_daily_rollup (
+    day           DATE            NOT NULL,
+    product_id    INTEGER         NOT NULL,
+    quantity      INTEGER         NOT NULL DEFAULT 0,
+    cost          DECIMAL(14, 2)  NOT NULL DEFAULT 0,
+    created_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (day, product_id)
+);
+COMMENT ON TABLE public.import_daily_rollup IS 'Daily imports per product, maintained when imports are committed';
+
+-- Backfill rollups from existing orders and imports
+INSERT INTO public.sales_daily_rollup (day, product_id, quantity, revenue, discount, cost)
+SELECT o.order_at, ol.product_id, SUM(ol.quantity), SUM(ol.quantity * ol.sale_price),
+       SUM(ol.discount), SUM(ol.quantity * p.unit_price)
+FROM public.order_line ol
+JOIN public.order o ON o.id = ol.order_id
+JOIN public.product p ON p.id = ol.product_id
+GROUP BY o.order_at, ol.product_id;
+
+INSERT INTO public.import_daily_rollup (day, product_id, quantity, cost)
+SELECT i.imported_at, il.product_id, SUM(il.quantity), SUM(il.quantity * il.unit_price)
+FROM public.import_line il
+JOIN public.importer i ON i.id = il.importer_id
+GROUP BY i.imported_at, il.product_id;
@@ -0,0 +1,18 @@
+-- 0.6.0
+CREATE TABLE IF NOT EXISTS public.order_queue (
+    id                SERIAL          PRIMARY KEY,
+    idempotency_key   VARCHAR(255)    NOT NULL,
+    created_by        INTEGER         NOT NULL,
+    payload           JSONB           NOT NULL,
+    status            SMALLINT        NOT NULL DEFAULT 0,
+    attempts          SMALLINT        NOT NULL DEFAULT 0,
+    order_id          INTEGER,
+    error             TEXT,
+    created_at        TIMESTAMP       NOT NULL DEFAULT NOW(),
+    updated_at        TIMESTAMP       NOT NULL DEFAULT NOW(),
+    FOREIGN KEY (created_by) REFERENCES public.users (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (order_id) REFERENCES public.order (id) ON DELETE SET NULL ON UPDATE CASCADE
+);
+COMMENT ON TABLE public.order_queue IS 'Submitted orders. The `status` field is 0 = Queued, 1 = Processing, 2 = Success, 3 = Failed';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_order_queue_idempotency_key ON public.order_queue (created_by, idempotency_key);
+CREATE INDEX IF NOT EXISTS idx_order_queue_pending ON public.order_queue (id) WHERE status IN (0, 1);
@@ -0,0 +1,45 @@
+-- 0.7.0
+CREATE TABLE IF NOT EXISTS public.stock_movement (
+    id            BIGSERIAL       PRIMARY KEY,
+    product_id    INTEGER         NOT NULL,
+    quantity      INTEGER         NOT NULL,
+    moved_at      DATE            NOT NULL,
+    source_type   SMALLINT        NOT NULL,
+    source_id     INTEGER,
+    created_at    TIMESTAMP       NOT NULL DEFAULT NOW()
+);
+COMMENT ON TABLE public.stock_movement IS 'Append-only stock changes. The `source_type` field is 1 = Import, 2 = Order, 3 = Adjustment';
+CREATE INDEX IF NOT EXISTS idx_stock_movement_product_moved_at ON public.stock_movement (product_id, moved_at);
+CREATE INDEX IF NOT EXISTS idx_stock_movement_moved_at ON public.stock_movement (moved_at);
+
+CREATE TABLE IF NOT EXISTS public.stock_snapshot (
+    day           DATE            NOT NULL,
+    product_id    INTEGER         NOT NULL,
+    quantity      INTEGER         NOT NULL,
+    created_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMP       NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (day, product_id)
+);
+COMMENT ON TABLE public.stock_snapshot IS 'Stock of every moved product at the end of a day, the sum of its movements up to that day';
+
+-- Backfill the ledger from existing imports and orders
+INSERT INTO public.stock_movement (product_id, quantity, moved_at, source_type, source_id)
+SELECT il.product_id, il.quantity, i.imported_at, 1, i.id
+FROM public.import_line il
+JOIN public.importer i ON i.id = il.importer_id
+ORDER BY i.id;
+
+INSERT INTO public.stock_movement (product_id, quantity, moved_at, source_type, source_id)
+SELECT ol.product_id, -ol.quantity, o.order_at, 2, o.id
+FROM public.order_line ol
+JOIN public.order o ON o.id = ol.order_id
+ORDER BY o.id;
+
+-- Stock not explained by imports and orders becomes an opening adjustment
+INSERT INTO public.stock_movement (product_id, quantity, moved_at, source_type)
+SELECT p.id, p.stock_quantity - COALESCE(m.quantity, 0), p.created_at::DATE, 3
+FROM public.product p
+LEFT JOIN (
+    SELECT product_id, SUM(quantity) AS quantity FROM public.stock_movement GROUP BY product_id
+) m ON m.product_id = p.id
+WHERE p.stock_quantity <> COALESCE(m.quantity, 0);
@@ -0,0 +1,45 @@
+-- 0.8.0
+ALTER TABLE public.product ADD COLUMN IF NOT EXISTS average_cost DECIMAL(12, 4);
+COMMENT ON COLUMN public.product.average_cost IS 'Weighted-average cost of the stock, updated by imports. NULL until the first import, when `unit_price` is used';
+ALTER TABLE public.order_line ADD COLUMN IF NOT EXISTS unit_cost DECIMAL(12, 4);
+COMMENT ON COLUMN public.order_line.unit_cost IS 'Unit cost of the product when the order was created';
+
+-- Backfill costs from the average import price up to each date
+CREATE TEMP TABLE import_cost AS
+SELECT il.product_id, i.imported_at,
+       SUM(SUM(il.quantity * il.unit_price)) OVER w / NULLIF(SUM(SUM(il.quantity)) OVER w, 0) AS average_cost
+FROM public.import_line il
+JOIN public.importer i ON i.id = il.importer_id
+GROUP BY il.product_id, i.imported_at
+WINDOW w AS (PARTITION BY il.product_id ORDER BY i.imported_at);
+CREATE INDEX ON import_cost (product_id, imported_at);
+
+UPDATE public.product p SET average_cost = (
+    SELECT c.average_cost FROM import_cost c
+    WHERE c.product_id = p.id
+    ORDER BY c.imported_at DESC LIMIT 1
+);
+
+UPDATE public.order_line ol SET unit_cost = COALESCE(
+    (
+        SELECT c.average_cost FROM import_cost c
+        WHERE c.product_id = ol.product_id AND c.imported_at <= o.order_at
+        ORDER BY c.imported_at DESC LIMIT 1
+    ),
+    (SELECT p.unit_price FROM public.product p WHERE p.id = ol.product_id),
+    0
+)
+FROM public.order o
+WHERE o.id = ol.order_id;
+ALTER TABLE public.order_line ALTER COLUMN unit_cost SET NOT NULL;
+DROP TABLE import_cost;
+
+-- Recompute the cost of the sales rollup from the stamped unit costs
+UPDATE public.sales_daily_rollup r SET cost = c.cost, updated_at = NOW()
+FROM (
+    SELECT o.order_at, ol.product_id, SUM(ol.quantity * ol.unit_cost) AS cost
+    FROM public.order_line ol
+    JOIN public.order o ON o.id = ol.order_id
+    GROUP BY o.order_at, ol.product_id
+) c
+WHERE r.day = c.order_at AND r.product_id = c.product_id;
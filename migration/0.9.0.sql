@@ -0,0 +1,4 @@
+-- 0.9.0
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_product_sku_trgm ON public.product USING GIN (sku gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_product_name_trgm ON public.product USING GIN (name gin_trgm_ops);
@@ -1,9 +1,14 @@
-from flask import Flask, jsonify
-from flask_login import LoginManager
+from time import perf_counter
+
+from flask import Flask, Response, g, jsonify, request
+from flask_login import LoginManager, current_user
 from flask_cors import CORS
 
-from src.default import FRONTEND_URL
+from src.default import FRONTEND_URL, METRICS_ALLOWED_IPS
+from src.helpers.query_stats import query_stats
+from src.helpers.request_metrics import request_metrics
 from src.models.user import User
+from src.repository import PostgresSession
 from src.services.user import UserService
 
 login_manager = LoginManager()
@@ -11,7 +16,23 @@ user_service = UserService()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return user_service.get_user_by_id(user_id)
+    return user_service.get_cached_user(user_id)
+
+def _route_of(request):
+    return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+
+def _observe_stream(chunks, started_at, labels):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        request_metrics.observe(*labels, perf_counter() - started_at, size)
+
 
 def create_app(config_filename=None):
     app = Flask(__name__)
@@ -20,8 +41,8 @@ def create_app(config_filename=None):
     CORS(app, 
          origins=[FRONTEND_URL],
          supports_credentials=True,
-         allow_headers=["Content-Type", "Authorization"],
-         expose_headers=["Set-Cookie"],
+         allow_headers=["Content-Type", "Authorization", "If-None-Match", "Idempotency-Key"],
+         expose_headers=["Set-Cookie", "X-Next-Cursor"],
          methods=["GET", "POST", "OPTIONS"])
     
     if config_filename:
@@ -54,6 +75,49 @@ def create_app(config_filename=None):
             'isAuthenticated': False
         }), 401
     
+    # Count the statements of every request; streamed responses end in teardown
+    @app.before_request
+    def begin_query_stats():
+        g.request_started_at = perf_counter()
+        query_stats.begin_request(f'{request.method} {_route_of(request)}')
+
+    @app.after_request
+    def add_query_timing(response):
+        if queries := query_stats.current:
+            response.headers['Server-Timing'] = (
+                f'db;dur={queries.total_time * 1000:.1f};desc="{queries.count} statements"'
+            )
+        return response
+
+    # Record latency and size of every response; streamed ones once fully sent
+    @app.after_request
+    def observe_request(response):
+        started_at = g.get('request_started_at', perf_counter())
+        labels = (request.method, _route_of(request), response.status_code)
+        if response.is_streamed:
+            response.response = _observe_stream(response.response, started_at, labels)
+        else:
+            request_metrics.observe(
+                *labels, perf_counter() - started_at, response.content_length or 0
+            )
+        return response
+
+    # Served to logged-in users and to the allowlisted scrape addresses only
+    @app.route('/metrics')
+    def metrics():
+        if request.remote_addr not in METRICS_ALLOWED_IPS and not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        return Response(request_metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    @app.teardown_request
+    def end_query_stats(exception=None):
+        query_stats.end_request()
+
+    # Return pooled connections at the end of every request
+    @app.teardown_appcontext
+    def remove_db_sessions(exception=None):
+        PostgresSession.remove_sessions()
+
     # Register blueprints
     from src.modules.routes import blueprint as routes_blueprint
     app.register_blueprint(routes_blueprint, url_prefix='/api/v1')
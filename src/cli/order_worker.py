@@ -0,0 +1,49 @@
+from argparse import ArgumentParser
+from logging import INFO, basicConfig, getLogger
+from threading import Event, Thread
+
+from src.default import ORDER_QUEUE_BATCH_SIZE
+from src.repository import PostgresSession
+from src.services.order_queue import OrderQueueService
+
+arg_parser = ArgumentParser(description='Create queued orders')
+arg_parser.add_argument('-w', '--workers', help='Number of worker threads', type=int, default=2)
+arg_parser.add_argument('-b', '--batch-size', help='Jobs claimed per batch', type=int,
+                        default=ORDER_QUEUE_BATCH_SIZE)
+arg_parser.add_argument('-i', '--poll-interval', help='Seconds to wait when the queue is empty',
+                        type=float, default=1.0)
+arg_parser.add_argument('--once', help='Exit once the queue is empty', action='store_true')
+args = arg_parser.parse_args()
+
+basicConfig(level=INFO, format='%(asctime)s %(levelname)s %(threadName)s %(message)s')
+logger = getLogger(__name__)
+stopped = Event()
+
+
+def work():
+    service = OrderQueueService()
+    while not stopped.is_set():
+        try:
+            processed = service.drain(args.batch_size)
+        except Exception as e:
+            logger.exception(f'Failed to drain the order queue: {e}')
+            processed = 0
+        finally:
+            PostgresSession.remove_sessions()
+
+        if not processed:
+            if args.once:
+                return
+            stopped.wait(args.poll_interval)
+
+
+threads = [Thread(target=work, name=f'order-worker-{index}') for index in range(args.workers)]
+for thread in threads:
+    thread.start()
+try:
+    for thread in threads:
+        thread.join()
+except KeyboardInterrupt:
+    stopped.set()
+    for thread in threads:
+        thread.join()
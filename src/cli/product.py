@@ -1,11 +1,17 @@
+import json
 from argparse import ArgumentParser
+from logging import INFO, basicConfig
 
 from src.services.product import ProductService
 
 arg_parser = ArgumentParser(description='Product Importer')
 arg_parser.add_argument('-f', '--file', help='CSV file path', required=True)
+arg_parser.add_argument('-c', '--chunk-size', help='Rows per COPY and upsert', type=int, default=5000)
+arg_parser.add_argument('--dry-run', help='Report changes without writing them', action='store_true')
 args = arg_parser.parse_args()
 file_path = args.file
 
+basicConfig(level=INFO, format='%(asctime)s %(levelname)s %(message)s')
 service = ProductService()
-service.import_products_from_csv(file_path)
+report = service.import_products_from_csv(file_path, chunk_size=args.chunk_size, dry_run=args.dry_run)
+print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,25 @@
+import json
+from argparse import ArgumentParser
+from datetime import datetime
+from logging import INFO, basicConfig
+
+from src.services.rollup import RollupService
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+arg_parser = ArgumentParser(description='Rebuild the daily sales and import rollups')
+arg_parser.add_argument('-s', '--start-date', help='First day to rebuild (YYYY-MM-DD)', type=parse_date)
+arg_parser.add_argument('-e', '--end-date', help='Last day to rebuild (YYYY-MM-DD)', type=parse_date)
+arg_parser.add_argument('--sketches-only', help='Only build the missing top sketches', action='store_true')
+args = arg_parser.parse_args()
+
+basicConfig(level=INFO, format='%(asctime)s %(levelname)s %(message)s')
+service = RollupService()
+if args.sketches_only:
+    report = service.build_sketches(args.start_date, args.end_date)
+else:
+    report = service.rebuild(args.start_date, args.end_date)
+print(json.dumps(report, indent=2))
@@ -0,0 +1,32 @@
+import json
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from logging import INFO, basicConfig
+
+from src.services.stock import StockService
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+arg_parser = ArgumentParser(description='Snapshot and reconcile the stock movement ledger')
+commands = arg_parser.add_subparsers(dest='command', required=True)
+snapshot_parser = commands.add_parser('snapshot', help='Store the stock of every product at the end of a day')
+snapshot_parser.add_argument('-d', '--day', help='Day to snapshot (YYYY-MM-DD), yesterday by default',
+                             type=parse_date)
+reconcile_parser = commands.add_parser('reconcile', help='Check product stock quantities against the ledger')
+reconcile_parser.add_argument('--fix', help='Record the differences as adjustments dated today',
+                              action='store_true')
+args = arg_parser.parse_args()
+
+basicConfig(level=INFO, format='%(asctime)s %(levelname)s %(message)s')
+service = StockService()
+if args.command == 'snapshot':
+    report = service.take_snapshot(args.day)
+else:
+    report = service.reconcile(fix=args.fix)
+print(json.dumps(report, indent=2))
+if args.command == 'reconcile' and report['drifted'] and not args.fix:
+    sys.exit(1)
@@ -1,4 +1,38 @@
-from decouple import config
+from decouple import Csv, config
 
 SQLALCHEMY_DATABASE_URI = config('SQLALCHEMY_DATABASE_URI')
-FRONTEND_URL = config('FRONTEND_URL')
\ No newline at end of file
+SQLALCHEMY_POOL_SIZE = config('SQLALCHEMY_POOL_SIZE', default=5, cast=int)
+SQLALCHEMY_MAX_OVERFLOW = config('SQLALCHEMY_MAX_OVERFLOW', default=10, cast=int)
+SQLALCHEMY_POOL_TIMEOUT = config('SQLALCHEMY_POOL_TIMEOUT', default=30, cast=int)
+SQLALCHEMY_POOL_RECYCLE = config('SQLALCHEMY_POOL_RECYCLE', default=1800, cast=int)
+SQLALCHEMY_POOL_PRE_PING = config('SQLALCHEMY_POOL_PRE_PING', default=True, cast=bool)
+ALLOW_NEGATIVE_STOCK = config('ALLOW_NEGATIVE_STOCK', default=True, cast=bool)
+DEFAULT_PAGE_SIZE = config('DEFAULT_PAGE_SIZE', default=500, cast=int)
+MAX_PAGE_SIZE = config('MAX_PAGE_SIZE', default=1000, cast=int)
+KEY_LOOKUP_CHUNK_SIZE = config('KEY_LOOKUP_CHUNK_SIZE', default=10000, cast=int)
+METRICS_CACHE_SIZE = config('METRICS_CACHE_SIZE', default=256, cast=int)
+METRICS_CACHE_TTL = config('METRICS_CACHE_TTL', default=300, cast=int)
+DASHBOARD_TOP_LIMIT = config('DASHBOARD_TOP_LIMIT', default=10, cast=int)
+DASHBOARD_TOP_MAX_LIMIT = config('DASHBOARD_TOP_MAX_LIMIT', default=100, cast=int)
+DASHBOARD_SKETCH_CAPACITY = config('DASHBOARD_SKETCH_CAPACITY', default=100, cast=int)
+USER_CACHE_SIZE = config('USER_CACHE_SIZE', default=1024, cast=int)
+USER_CACHE_TTL = config('USER_CACHE_TTL', default=300, cast=int)
+CUSTOMER_CACHE_SIZE = config('CUSTOMER_CACHE_SIZE', default=10000, cast=int)
+CUSTOMER_CACHE_TTL = config('CUSTOMER_CACHE_TTL', default=3600, cast=int)
+PRODUCT_CATALOG_REFRESH_INTERVAL = config('PRODUCT_CATALOG_REFRESH_INTERVAL', default=5, cast=float)
+PRODUCT_CATALOG_TTL = config('PRODUCT_CATALOG_TTL', default=3600, cast=float)
+ORDER_QUEUE_BATCH_SIZE = config('ORDER_QUEUE_BATCH_SIZE', default=50, cast=int)
+ORDER_QUEUE_MAX_ATTEMPTS = config('ORDER_QUEUE_MAX_ATTEMPTS', default=3, cast=int)
+ORDER_QUEUE_VISIBILITY_TIMEOUT = config('ORDER_QUEUE_VISIBILITY_TIMEOUT', default=300, cast=int)
+ORDER_BATCH_MAX_SIZE = config('ORDER_BATCH_MAX_SIZE', default=500, cast=int)
+QUERY_SLOW_STATEMENT_MS = config('QUERY_SLOW_STATEMENT_MS', default=200, cast=float)
+QUERY_SLOW_REQUEST_MS = config('QUERY_SLOW_REQUEST_MS', default=500, cast=float)
+QUERY_N_PLUS_ONE_THRESHOLD = config('QUERY_N_PLUS_ONE_THRESHOLD', default=10, cast=int)
+QUERY_STATS_MAX_STATEMENTS = config('QUERY_STATS_MAX_STATEMENTS', default=200, cast=int)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=float)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+PRODUCT_SEARCH_LIMIT = config('PRODUCT_SEARCH_LIMIT', default=10, cast=int)
+PRODUCT_SEARCH_MAX_LIMIT = config('PRODUCT_SEARCH_MAX_LIMIT', default=50, cast=int)
+PRODUCT_SEARCH_DATABASE_FALLBACK = config('PRODUCT_SEARCH_DATABASE_FALLBACK', default=True, cast=bool)
+FRONTEND_URL = config('FRONTEND_URL')
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from threading import RLock
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+CACHES = {}
+
+
+class TTLCache:
+    """Thread-safe, process-local LRU cache whose entries expire after `ttl` seconds.
+
+    Every cache created with a name is registered in `CACHES` so that its hit and
+    miss counters can be reported with `cache_stats`.
+    """
+
+    def __init__(self, name: str = None, maxsize: int = 128, ttl: float = None):
+        """
+        :param name: Name used to report the cache statistics
+        :param maxsize: Maximum number of entries; the least recently used is evicted first
+        :param ttl: Seconds an entry stays valid. Entries never expire if not specified.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+        if name:
+            CACHES[name] = self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] is not None and entry[0] <= monotonic():
+                del self._entries[key]
+                entry = _MISSING
+
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            expires_at = monotonic() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_many(self, items: dict):
+        with self._lock:
+            for key, value in items.items():
+                self.set(key, value)
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value of `key`, computing and caching it with `factory` on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            if self._entries.pop(key, _MISSING) is _MISSING:
+                return False
+            self.invalidations += 1
+            return True
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches `predicate`
+
+        :return: The number of dropped entries
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / requests, 4) if requests else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+def cache_stats() -> dict:
+    """Return the statistics of every named cache of this process"""
+    return {name: cache.stats() for name, cache in CACHES.items()}
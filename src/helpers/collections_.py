@@ -1,5 +1,6 @@
 import types
-from typing import Any, Generator, Sequence
+from itertools import islice
+from typing import Any, Generator, Iterable, Sequence
 
 
 def is_generator(value: Any) -> bool:
@@ -35,6 +36,21 @@ def flatten(seq: Any) -> Generator:
             yield item
 
 
+def chunked(iterable: Iterable, size: int) -> Generator:
+    """Split `iterable` into lists of at most `size` items, lazily.
+
+    :param iterable: Iterable to split
+    :param size: Maximum number of items per chunk
+    :return: Generator of lists
+    """
+    if size <= 0:
+        raise ValueError('size must be greater than 0')
+
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
 def check_not_empty(reference: Any, message: str = None) -> Any:
     """Check if the given reference is not empty.
 
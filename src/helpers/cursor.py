@@ -0,0 +1,40 @@
+import base64
+import binascii
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Any, Sequence
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the keyset values of the last returned row as an opaque cursor.
+
+    :param values: Keyset values, e.g. `(order_at, id)`
+    :return: URL-safe cursor string
+    """
+    def default(value):
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        raise TypeError(f'Unsupported cursor value {value!r}')
+
+    payload = json.dumps(list(values), default=default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    """Decode a cursor produced by `encode_cursor`.
+
+    :param cursor: Cursor string
+    :return: List of raw keyset values
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
@@ -0,0 +1,182 @@
+import re
+from collections import Counter
+from contextvars import ContextVar
+from logging import getLogger
+from threading import Lock
+from time import perf_counter
+
+from sqlalchemy import event
+
+from src.default import (
+    QUERY_N_PLUS_ONE_THRESHOLD, QUERY_SLOW_REQUEST_MS, QUERY_SLOW_STATEMENT_MS,
+    QUERY_STATS_MAX_STATEMENTS
+)
+
+NO_REQUEST = '<no request>'
+_PLACEHOLDERS = re.compile(r'%\(\w+\)s(?:\s*,\s*%\(\w+\)s)*')
+_WHITESPACE = re.compile(r'\s+')
+
+logger = getLogger(__name__)
+
+
+class RequestQueries:
+    """Statements executed while serving one request."""
+
+    __slots__ = ('endpoint', 'count', 'total_time', 'slowest', 'slowest_time', 'shapes')
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = None
+        self.slowest_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, shape: str, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[shape] += 1
+        if elapsed > self.slowest_time:
+            self.slowest, self.slowest_time = shape, elapsed
+
+    def repeated_shapes(self, threshold: int) -> dict:
+        """Statement shapes run more than `threshold` times, the sign of an N+1 query"""
+        return {shape: count for shape, count in self.shapes.items() if count > threshold}
+
+
+class QueryStats:
+    """Collects statement counts and timings from SQLAlchemy engine events.
+
+    Statements are grouped by shape: the SQL text with runs of bound parameters
+    collapsed to `?`, so `IN` lists of any length share one shape. Counters are
+    kept per endpoint and per shape, and a request that is slow or repeats a
+    shape more than `n_plus_one_threshold` times is logged.
+    """
+
+    def __init__(self, slow_statement_ms: float = 200, slow_request_ms: float = 500,
+                 n_plus_one_threshold: int = 10, max_statements: int = 200):
+        """
+        :param slow_statement_ms: Log statements running longer than this
+        :param slow_request_ms: Log requests spending longer than this in the database
+        :param n_plus_one_threshold: Flag requests running one shape more often than this
+        :param max_statements: Maximum number of statement shapes kept; the cheapest is dropped first
+        """
+        self.slow_statement_ms = slow_statement_ms
+        self.slow_request_ms = slow_request_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.max_statements = max_statements
+        self._current = ContextVar('request_queries', default=None)
+        self._lock = Lock()
+        self._endpoints = {}
+        self._statements = {}
+
+    def instrument(self, engine):
+        """Listen to the statements of `engine`"""
+        if event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def begin_request(self, endpoint: str):
+        self._current.set(RequestQueries(endpoint))
+
+    def end_request(self) -> RequestQueries:
+        """Stop collecting for the current request, aggregating and logging what it ran"""
+        queries = self._current.get()
+        if queries is None:
+            return None
+        self._current.set(None)
+
+        total_ms = queries.total_time * 1000
+        repeated = queries.repeated_shapes(self.n_plus_one_threshold)
+        with self._lock:
+            stats = self._endpoints.setdefault(queries.endpoint, {
+                'requests': 0, 'statements': 0, 'total_ms': 0.0, 'max_statements': 0,
+                'max_ms': 0.0, 'slow_requests': 0, 'n_plus_one_requests': 0
+            })
+            stats['requests'] += 1
+            stats['statements'] += queries.count
+            stats['total_ms'] += total_ms
+            stats['max_statements'] = max(stats['max_statements'], queries.count)
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+            stats['slow_requests'] += total_ms > self.slow_request_ms
+            stats['n_plus_one_requests'] += bool(repeated)
+
+        if total_ms > self.slow_request_ms:
+            logger.warning(
+                f'Slow request {queries.endpoint}: {queries.count} statements in {total_ms:.1f}ms, '
+                f'slowest {queries.slowest_time * 1000:.1f}ms: {queries.slowest}'
+            )
+        for shape, count in repeated.items():
+            logger.warning(f'Possible N+1 in {queries.endpoint}: {count} x {shape}')
+        return queries
+
+    @property
+    def current(self) -> RequestQueries:
+        return self._current.get()
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    **stats,
+                    'avg_statements': round(stats['statements'] / stats['requests'], 2),
+                    'avg_ms': round(stats['total_ms'] / stats['requests'], 3),
+                    'total_ms': round(stats['total_ms'], 3),
+                    'max_ms': round(stats['max_ms'], 3)
+                }
+                for endpoint, stats in self._endpoints.items() if stats['requests']
+            }
+            statements = sorted(
+                ({'statement': shape, **stats} for shape, stats in self._statements.items()),
+                key=lambda stats: stats['total_ms'], reverse=True
+            )
+        for stats in statements:
+            stats['avg_ms'] = round(stats['total_ms'] / stats['count'], 3)
+            stats['total_ms'] = round(stats['total_ms'], 3)
+            stats['max_ms'] = round(stats['max_ms'], 3)
+        return {'endpoints': endpoints, 'statements': statements}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._statements.clear()
+
+    @staticmethod
+    def shape_of(statement: str) -> str:
+        return _PLACEHOLDERS.sub('?', _WHITESPACE.sub(' ', statement).strip())
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, so a failed statement leaves nothing behind
+        context.query_started_at = perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - context.query_started_at
+        elapsed_ms = elapsed * 1000
+        shape = self.shape_of(statement)
+
+        queries = self._current.get()
+        if queries is not None:
+            queries.record(shape, elapsed)
+        if elapsed_ms > self.slow_statement_ms:
+            endpoint = queries.endpoint if queries else NO_REQUEST
+            logger.warning(f'Slow statement in {endpoint} ({elapsed_ms:.1f}ms): {shape}')
+
+        with self._lock:
+            stats = self._statements.get(shape)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    cheapest = min(self._statements, key=lambda key: self._statements[key]['total_ms'])
+                    del self._statements[cheapest]
+                stats = self._statements[shape] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+
+query_stats = QueryStats(
+    slow_statement_ms=QUERY_SLOW_STATEMENT_MS,
+    slow_request_ms=QUERY_SLOW_REQUEST_MS,
+    n_plus_one_threshold=QUERY_N_PLUS_ONE_THRESHOLD,
+    max_statements=QUERY_STATS_MAX_STATEMENTS
+)
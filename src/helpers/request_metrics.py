@@ -0,0 +1,254 @@
+import atexit
+import json
+import os
+from bisect import bisect_left
+from glob import glob
+from logging import getLogger
+from threading import Lock
+from time import monotonic, time
+
+from src.default import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = getLogger(__name__)
+
+
+class Histogram:
+    """Per-bucket (not cumulative) counts plus sum and count, mergeable across processes."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds, counts=None, sum_=0.0, count=0):
+        self.bounds = bounds
+        # One count per bound plus the +Inf bucket
+        self.counts = list(counts) if counts else [0] * (len(bounds) + 1)
+        self.sum = sum_
+        self.count = count
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: 'Histogram'):
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation within its bucket, as Prometheus does"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index else 0.0
+                return lower + (self.bounds[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def to_dict(self) -> dict:
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+
+class RouteMetrics:
+    __slots__ = ('latency', 'size', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.statuses = {}
+
+    def merge(self, other: 'RouteMetrics'):
+        self.latency.merge(other.latency)
+        self.size.merge(other.size)
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+    @property
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if int(status) >= 500)
+
+    def to_dict(self) -> dict:
+        return {
+            'latency': self.latency.to_dict(),
+            'size': self.size.to_dict(),
+            'statuses': self.statuses
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'RouteMetrics':
+        metrics = cls()
+        metrics.latency = Histogram(LATENCY_BUCKETS, data['latency']['counts'],
+                                    data['latency']['sum'], data['latency']['count'])
+        metrics.size = Histogram(SIZE_BUCKETS, data['size']['counts'],
+                                 data['size']['sum'], data['size']['count'])
+        metrics.statuses = dict(data['statuses'])
+        return metrics
+
+
+class RequestMetrics:
+    """Per-route request latency, response size and status counters.
+
+    Each process keeps its own counters. When `directory` is set, a process writes
+    them to `<directory>/requests-<pid>-<start>.json` at most every `flush_interval`
+    seconds, and `collect` merges the files of every worker, so any uwsgi worker
+    can serve the totals. Files of stopped workers are kept so counters never go
+    backwards; clear the directory when the application is deployed.
+    """
+
+    def __init__(self, directory: str = None, flush_interval: float = 5):
+        """
+        :param directory: Directory shared by the workers, counters stay per process if not specified
+        :param flush_interval: Seconds between two writes of this process' counters
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._routes = {}
+        self._lock = Lock()
+        self._flushed_at = monotonic()
+        self._file_path = None
+
+    def observe(self, method: str, route: str, status: int, seconds: float, size: int):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.size.observe(size)
+            metrics.statuses[str(status)] = metrics.statuses.get(str(status), 0) + 1
+
+        if self.directory and monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process' counters to the shared directory"""
+        if not self.directory:
+            return
+
+        with self._lock:
+            self._flushed_at = monotonic()
+            data = {f'{method} {route}': metrics.to_dict()
+                    for (method, route), metrics in self._routes.items()}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._get_file_path()
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(data, file)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logger.error(f'Failed to write request metrics: {e}')
+
+    def collect(self) -> dict:
+        """Merge the counters of every worker, keyed by (method, route)"""
+        if not self.directory:
+            with self._lock:
+                return {key: RouteMetrics.from_dict(metrics.to_dict())
+                        for key, metrics in self._routes.items()}
+
+        self.flush()
+        merged = {}
+        for path in glob(os.path.join(self.directory, 'requests-*.json')):
+            try:
+                with open(path) as file:
+                    data = json.load(file)
+            except (OSError, ValueError):
+                continue  # Being replaced by its worker
+            for key, metrics in data.items():
+                method, route = key.split(' ', 1)
+                metrics = RouteMetrics.from_dict(metrics)
+                if (method, route) in merged:
+                    merged[(method, route)].merge(metrics)
+                else:
+                    merged[(method, route)] = metrics
+        return merged
+
+    def to_prometheus(self) -> str:
+        """Render the merged counters in the Prometheus text exposition format"""
+        routes = sorted(self.collect().items())
+        lines = [
+            '# HELP http_requests_total Requests served, by route and status.',
+            '# TYPE http_requests_total counter'
+        ]
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+
+        lines += [
+            '# HELP http_request_errors_total Requests answered with a 5xx status, by route.',
+            '# TYPE http_request_errors_total counter'
+        ]
+        for (method, route), metrics in routes:
+            lines.append(f'http_request_errors_total{{{_labels(method, route)}}} {metrics.errors}')
+
+        lines += _histogram_lines(
+            'http_request_duration_seconds', 'Request latency in seconds, by route.',
+            routes, lambda metrics: metrics.latency
+        )
+        lines += _histogram_lines(
+            'http_response_size_bytes', 'Response body size in bytes, by route.',
+            routes, lambda metrics: metrics.size
+        )
+
+        lines += [
+            '# HELP http_request_duration_quantile_seconds Latency quantiles estimated from the histogram.',
+            '# TYPE http_request_duration_quantile_seconds gauge'
+        ]
+        for (method, route), metrics in routes:
+            for q in QUANTILES:
+                value = metrics.latency.quantile(q)
+                lines.append(
+                    f'http_request_duration_quantile_seconds{{{_labels(method, route)},quantile="{q}"}} '
+                    f'{value:.6f}'
+                )
+        return '\n'.join(lines) + '\n'
+
+    def _get_file_path(self) -> str:
+        # Resolved on the first write, so workers forked from a preloading master get their own file
+        if self._file_path is None:
+            self._file_path = os.path.join(self.directory, f'requests-{os.getpid()}-{int(time())}.json')
+        return self._file_path
+
+
+def _labels(method: str, route: str) -> str:
+    route = route.replace('\\', '\\\\').replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+def _histogram_lines(name: str, help_: str, routes, get_histogram) -> list:
+    lines = [f'# HELP {name} {help_}', f'# TYPE {name} histogram']
+    for (method, route), metrics in routes:
+        histogram = get_histogram(metrics)
+        labels = _labels(method, route)
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def _warn_if_per_worker():
+    try:
+        import uwsgi
+    except ImportError:
+        return
+    if not METRICS_DIR and uwsgi.numproc > 1:
+        logger.warning(
+            f'METRICS_DIR is not set, so /metrics only reports the counters of the uwsgi worker '
+            f'answering the scrape out of {uwsgi.numproc}. Set it to a directory shared by the workers.'
+        )
+
+
+request_metrics = RequestMetrics(directory=METRICS_DIR or None, flush_interval=METRICS_FLUSH_INTERVAL)
+atexit.register(request_metrics.flush)
+_warn_if_per_worker()
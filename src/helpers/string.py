@@ -1,3 +1,20 @@
+import re
+import unicodedata
+
+_WORD = re.compile(r'\w+')
+
+
 def remove_apostrophe_string(value):
     # Escape single quotes by doubling them
-    return value.replace("'", "''") if isinstance(value, str) else value
\ No newline at end of file
+    return value.replace("'", "''") if isinstance(value, str) else value
+
+
+def normalize_search_text(value: str) -> str:
+    """Case fold and strip diacritics, so `Chả cá` and `cha ca` compare equal"""
+    decomposed = unicodedata.normalize('NFKD', value.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def search_tokens(value: str) -> list:
+    """Split a text into normalized words"""
+    return _WORD.findall(normalize_search_text(value))
@@ -1,17 +1,33 @@
 from .customer import Customer
+from .customer_daily_rollup import CustomerDailyRollup
+from .import_daily_rollup import ImportDailyRollup
 from .import_line import ImportLine
 from .importer import Importer
 from .order import Order
 from .order_line import OrderLine
+from .order_queue import OrderQueue
 from .product import Product
+from .rollup_version import RollupVersion
+from .sales_daily_rollup import SalesDailyRollup
+from .stock_movement import StockMovement
+from .stock_snapshot import StockSnapshot
+from .top_daily_sketch import TopDailySketch
 from .user import User
 
 __all__ = (
     'Customer',
+    'CustomerDailyRollup',
+    'ImportDailyRollup',
     'ImportLine',
     'Importer',
     'Order',
     'OrderLine',
+    'OrderQueue',
     'Product',
+    'RollupVersion',
+    'SalesDailyRollup',
+    'StockMovement',
+    'StockSnapshot',
+    'TopDailySketch',
     'User',
 )
@@ -1,8 +1,66 @@
-from sqlalchemy import Column, DateTime, func
+from sqlalchemy import Column, DateTime, Float, Numeric, func
 from sqlalchemy.ext.declarative import declarative_base
 
 
+class RowSerializer:
+    """Turns rows of selected columns into JSON-ready dicts.
+
+    The field names and the converters of each column are worked out once, so
+    serializing a row is a `zip` into a dict plus a call per converted value.
+    `Numeric` columns of up to `PRICE_SCALE` decimals hold prices and are converted to
+    `int`, the way the API returns prices. Finer ones, such as weighted-average costs,
+    are kept as exact `Decimal` values.
+    """
+
+    # Float is a Numeric subtype and already JSON-ready
+    CONVERTERS = ((Float, None), (Numeric, int))
+    PRICE_SCALE = 2
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.names = tuple(column.key for column in self.columns)
+        self.converters = tuple(
+            (column.key, converter) for column in self.columns
+            if (converter := self._get_converter(column)) is not None
+        )
+
+    def __call__(self, row) -> dict:
+        data = dict(zip(self.names, row))
+        for name, converter in self.converters:
+            if (value := data[name]) is not None:
+                data[name] = converter(value)
+        return data
+
+    @classmethod
+    def _get_converter(cls, column):
+        for type_, converter in cls.CONVERTERS:
+            if isinstance(column.type, type_):
+                if converter is int and (column.type.scale or 0) > cls.PRICE_SCALE:
+                    return None
+                return converter
+        return None
+
+
 class BaseModel:
+    _serializers = None
+
+    @classmethod
+    def get_serializer(cls, fields=None) -> RowSerializer:
+        """Get the row serializer of the model, built once per model and fields.
+
+        :param fields: list of column names to select and serialize, all columns if not specified
+        :return: a RowSerializer
+        """
+        if cls.__dict__.get('_serializers') is None:
+            cls._serializers = {}
+        key = tuple(fields) if fields else None
+        if (serializer := cls._serializers.get(key)) is None:
+            columns = [
+                column for column in cls.__table__.columns if not fields or column.name in fields
+            ]
+            serializer = cls._serializers[key] = RowSerializer(columns)
+        return serializer
+
     @classmethod
     def get_column_names(cls):
         """Get column names of the model.
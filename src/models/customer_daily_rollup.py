@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Computed, DATE, Integer, Numeric
+
+from src.models.base import Base, TimeTrackingMixin
+
+
+class CustomerDailyRollup(Base, TimeTrackingMixin):
+    __table_args__ = {'schema': 'public'}
+    __tablename__ = 'customer_daily_rollup'
+
+    day = Column(DATE, primary_key=True)
+    customer_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    discount = Column(Numeric(14, 2), nullable=False, default=0)
+    cost = Column(Numeric(14, 2), nullable=False, default=0)
+    profit = Column(Numeric(14, 2), Computed('revenue - cost - discount'))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.day}-{self.customer_id}'
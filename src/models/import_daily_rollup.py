@@ -0,0 +1,16 @@
+from sqlalchemy import Column, DATE, Integer, Numeric
+
+from src.models.base import Base, TimeTrackingMixin
+
+
+class ImportDailyRollup(Base, TimeTrackingMixin):
+    __table_args__ = {'schema': 'public'}
+    __tablename__ = 'import_daily_rollup'
+
+    day = Column(DATE, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    cost = Column(Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.day}-{self.product_id}'
@@ -18,6 +18,7 @@ class OrderLine(Base, TimeTrackingMixin):
     discount = Column(Numeric(10, 2), nullable=False)
     net_total_price = Column(Numeric(10, 2), nullable=False)
     gross_total_price = Column(Numeric(10, 2), nullable=False)
+    unit_cost = Column(Numeric(12, 4), nullable=False)
 
     order = relationship('Order', back_populates='order_lines')
 
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, Sequence, SmallInteger, String, Text, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+
+from src.models.base import Base, TimeTrackingMixin
+
+
+class OrderQueue(Base, TimeTrackingMixin):
+    __table_args__ = (
+        UniqueConstraint('created_by', 'idempotency_key', name='idx_order_queue_idempotency_key'),
+        {'schema': 'public'}
+    )
+    __tablename__ = 'order_queue'
+
+    STATUS_QUEUED = 0
+    STATUS_PROCESSING = 1
+    STATUS_SUCCESS = 2
+    STATUS_FAILED = 3
+    STATUS_NAMES = {
+        STATUS_QUEUED: 'Queued',
+        STATUS_PROCESSING: 'Processing',
+        STATUS_SUCCESS: 'Success',
+        STATUS_FAILED: 'Failed',
+    }
+
+    id = Column(Integer, Sequence('order_queue_id_seq'), primary_key=True)
+    idempotency_key = Column(String(255), nullable=False)
+    created_by = Column(Integer, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(SmallInteger, nullable=False, default=STATUS_QUEUED)
+    attempts = Column(SmallInteger, nullable=False, default=0)
+    order_id = Column(Integer)
+    error = Column(Text)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.id}'
+
+    @property
+    def status_name(self):
+        return self.STATUS_NAMES.get(self.status)
@@ -18,6 +18,7 @@ class Product(Base, TimeTrackingMixin):
     description = Column(Text)
     image_url = Column(Text, nullable=False)
     stock_quantity = Column(Integer, nullable=False, default=0)
+    average_cost = Column(Numeric(12, 4))
 
     def __repr__(self):
         return f'{self.__class__.__name__}:{self.id}'
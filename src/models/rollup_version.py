@@ -0,0 +1,14 @@
+from sqlalchemy import BigInteger, Column, DATE
+
+from src.models.base import Base, TimeTrackingMixin
+
+
+class RollupVersion(Base, TimeTrackingMixin):
+    __table_args__ = {'schema': 'public'}
+    __tablename__ = 'rollup_version'
+
+    day = Column(DATE, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.day}'
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Computed, DATE, Integer, Numeric
+
+from src.models.base import Base, TimeTrackingMixin
+
+
+class SalesDailyRollup(Base, TimeTrackingMixin):
+    __table_args__ = {'schema': 'public'}
+    __tablename__ = 'sales_daily_rollup'
+
+    day = Column(DATE, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    discount = Column(Numeric(14, 2), nullable=False, default=0)
+    cost = Column(Numeric(14, 2), nullable=False, default=0)
+    profit = Column(Numeric(14, 2), Computed('revenue - cost - discount'))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.day}-{self.product_id}'
@@ -0,0 +1,23 @@
+from sqlalchemy import BigInteger, Column, DATE, DateTime, Integer, Sequence, SmallInteger, func
+
+from src.models.base import Base
+
+
+class StockMovement(Base):
+    __table_args__ = {'schema': 'public'}
+    __tablename__ = 'stock_movement'
+
+    SOURCE_IMPORT = 1
+    SOURCE_ORDER = 2
+    SOURCE_ADJUSTMENT = 3
+
+    id = Column(BigInteger, Sequence('stock_movement_id_seq'), primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    moved_at = Column(DATE, nullable=False)
+    source_type = Column(SmallInteger, nullable=False)
+    source_id = Column(Integer)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.id}'
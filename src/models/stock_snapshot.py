@@ -0,0 +1,15 @@
+from sqlalchemy import Column, DATE, Integer
+
+from src.models.base import Base, TimeTrackingMixin
+
+
+class StockSnapshot(Base, TimeTrackingMixin):
+    __table_args__ = {'schema': 'public'}
+    __tablename__ = 'stock_snapshot'
+
+    day = Column(DATE, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.day}-{self.product_id}'
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, DATE, Integer, Numeric, String
+
+from src.models.base import Base, TimeTrackingMixin
+
+
+class TopDailySketch(Base, TimeTrackingMixin):
+    __table_args__ = {'schema': 'public'}
+    __tablename__ = 'top_daily_sketch'
+
+    dimension = Column(String(16), primary_key=True)
+    metric = Column(String(16), primary_key=True)
+    day = Column(DATE, primary_key=True)
+    item_id = Column(Integer, primary_key=True)
+    value = Column(Numeric(14, 2), nullable=False)
+    floor = Column(Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}:{self.dimension}-{self.metric}-{self.day}-{self.item_id}'
@@ -1,9 +1,19 @@
+import os
 from logging import getLogger
 from datetime import datetime
 
 from flask import Blueprint, flash, redirect, render_template, request, url_for, jsonify
 from flask_login import current_user, login_required, login_user, logout_user
 
+from src.default import (
+    DASHBOARD_TOP_LIMIT, DASHBOARD_TOP_MAX_LIMIT, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ORDER_BATCH_MAX_SIZE,
+    PRODUCT_SEARCH_LIMIT, PRODUCT_SEARCH_MAX_LIMIT
+)
+from src.helpers.cache import cache_stats
+from src.helpers.cursor import decode_cursor, encode_cursor
+from src.helpers.query_stats import query_stats
+from src.modules.streaming import stream_json_response
+from src.repository import PostgresSession
 from src.services.user import UserService
 from src.services.importer import ImporterService
 from src.services.dashboard import DashboardService
@@ -15,6 +25,51 @@ logger = getLogger(__name__)
 dashboard_service = DashboardService()
 
 
+def _get_page_args():
+    """
+    Read the `limit` and `cursor` query arguments of a listing endpoint. Without either,
+    the page size is `None` and the whole listing is returned.
+    """
+    cursor = request.args.get('cursor')
+    if 'limit' not in request.args and not cursor:
+        return None, None
+
+    page_size = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    return page_size, decode_cursor(cursor) if cursor else None
+
+
+def _is_flag_set(name):
+    """Whether a boolean query argument such as `?stream=true` is set"""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def _is_stream_requested():
+    """Whether the client asked for the whole listing as a streamed JSON array"""
+    return _is_flag_set('stream')
+
+
+def _order_job_dict(job):
+    return {
+        'queue_id': job.id,
+        'status': job.status_name,
+        'order_id': job.order_id,
+        'error': job.error
+    }
+
+
+def _next_cursor(next_after):
+    return encode_cursor(next_after) if next_after else None
+
+
+def _list_response(items, next_after):
+    """Return a bare JSON list, passing the next page cursor in the `X-Next-Cursor` header"""
+    response = jsonify(items)
+    if next_cursor := _next_cursor(next_after):
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+
 @blueprint.route('/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -111,12 +166,55 @@ def index():
 def get_products():
     from src.services.product import ProductService
     service = ProductService()
-    products = []
-    for product in service.get_products():
-        product.unit_price = int(product.unit_price)
-        product.sale_price = int(product.sale_price)
-        products.append(product)
-    return jsonify([product.to_dict() for product in products]), 200
+    if _is_stream_requested():
+        return stream_json_response(service.iter_products())
+
+    try:
+        page_size, after = _get_page_args()
+        catalog = service.get_catalog()
+        if request.if_none_match.contains(catalog.etag):
+            return '', 304, {'ETag': f'"{catalog.etag}"'}
+        products, next_after = catalog.page(page_size, after)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    response, status = _list_response(products, next_after)
+    response.set_etag(catalog.etag)
+    return response, status
+
+
+@blueprint.route('/products/search', methods=['GET'])
+@login_required
+def search_products():
+    from src.services.product import ProductService
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({'success': False, 'message': 'q is required'}), 400
+
+    limit = request.args.get('limit', PRODUCT_SEARCH_LIMIT, type=int)
+    limit = max(1, min(limit, PRODUCT_SEARCH_MAX_LIMIT))
+    return jsonify(ProductService().search_products(query, limit)), 200
+
+
+@blueprint.route('/products/stock', methods=['GET'])
+@login_required
+def get_stock_at():
+    from src.services.stock import StockService
+    try:
+        day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'A valid date (YYYY-MM-DD) is required'}), 400
+
+    product_ids = request.args.getlist('product_id', type=int) or None
+    stock = StockService().get_stock_at(day, product_ids)
+    return jsonify({
+        'success': True,
+        'date': day.isoformat(),
+        'stock': [
+            {'product_id': product_id, 'stock_quantity': quantity}
+            for product_id, quantity in stock.items()
+        ]
+    }), 200
 
 
 @blueprint.route('/product/import', methods=['POST'])
@@ -160,8 +258,15 @@ def warehouse():
 def get_customers():
     from src.services.customer import CustomerService
     service = CustomerService()
-    customers = service.get_all_customers()
-    return jsonify([customer.to_dict() for customer in customers]), 200
+    if _is_stream_requested():
+        return stream_json_response(service.iter_customers())
+
+    try:
+        page_size, after = _get_page_args()
+        customers, next_after = service.get_customers_page(page_size, after)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return _list_response(customers, next_after)
 
 
 @blueprint.route('/order/tracking', methods=['GET', 'POST'])
@@ -189,39 +294,100 @@ def order_tracking():
 @blueprint.route('/dashboard/stats', methods=['GET'])
 @login_required
 def get_dashboard_stats():
-    total_products = user_service.get_total_products()  # Implement this method in UserService
-    total_imports = user_service.get_total_imports()    # Implement this method in UserService
-    total_orders = user_service.get_total_orders()      # Implement this method in UserService
-
-    return jsonify({
-        'totalProducts': total_products,
-        'totalImports': total_imports,
-        'totalOrders': total_orders
-    }), 200
+    return jsonify(dashboard_service.get_stats()), 200
 
 
 @blueprint.route('/order', methods=['POST'])
 @login_required
 def create_order():
+    """Create an order.
+
+    With `?async=true` the order is validated and queued, and a worker creates it later;
+    queued orders require an `Idempotency-Key` header. The header deduplicates retried
+    submissions in both modes.
+    """
     from src.services.order import OrderService
+    from src.services.order_queue import OrderQueueService
 
     order_service = OrderService()
+    queue_service = OrderQueueService()
     data = request.get_json()
+    idempotency_key = request.headers.get('Idempotency-Key')
 
     if not data or 'customer' not in data or 'order_lines' not in data:
         return jsonify({'success': False, 'message': 'Invalid data provided'}), 400
 
     try:
-        order, order_lines = order_service.create_order_from_request(data, current_user)
+        if _is_flag_set('async'):
+            job, created = queue_service.enqueue(data, current_user, idempotency_key)
+            return jsonify({
+                'success': True,
+                'message': 'Order queued' if created else 'Order already submitted',
+                **_order_job_dict(job)
+            }), 202
+
+        if idempotency_key:
+            job, order_lines = queue_service.create_order_once(data, current_user, idempotency_key)
+            if order_lines is None:
+                return jsonify({
+                    'success': job.status != job.STATUS_FAILED,
+                    'message': 'Order already submitted',
+                    **_order_job_dict(job)
+                }), 200 if job.order_id else 409
+            order_id = job.order_id
+        else:
+            order, order_lines = order_service.create_order_from_request(data, current_user)
+            order_id = order.id
+
         return jsonify({
             'success': True,
             'message': f'Imported {len(order_lines)} records',
-            'order_id': order.id
+            'order_id': order_id
         }), 201
     except ValueError as e:
         return jsonify({'success': False, 'message': str(e)}), 400
 
 
+@blueprint.route('/orders/batch', methods=['POST'])
+@login_required
+def create_orders_batch():
+    """Create many orders at once, reporting success or failure per order"""
+    from src.services.order import OrderService
+
+    data = request.get_json()
+    orders = data.get('orders') if isinstance(data, dict) else None
+    if not orders or not isinstance(orders, list):
+        return jsonify({'success': False, 'message': 'A list of orders is required'}), 400
+    if len(orders) > ORDER_BATCH_MAX_SIZE:
+        return jsonify({
+            'success': False,
+            'message': f'At most {ORDER_BATCH_MAX_SIZE} orders can be submitted at once'
+        }), 400
+
+    try:
+        results = OrderService().create_orders_batch(orders, current_user)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    created = sum(result['success'] for result in results)
+    return jsonify({
+        'success': created == len(results),
+        'message': f'Created {created} of {len(results)} orders',
+        'results': results
+    }), 201 if created else 400
+
+
+@blueprint.route('/order/queue/<int:queue_id>', methods=['GET'])
+@login_required
+def get_order_job(queue_id):
+    from src.services.order_queue import OrderQueueService
+
+    job = OrderQueueService().get_job(queue_id, current_user)
+    if not job:
+        return jsonify({'success': False, 'message': 'Queued order not found'}), 404
+    return jsonify({'success': True, **_order_job_dict(job)}), 200
+
+
 @blueprint.route('/importers', methods=['GET'])
 @login_required
 def get_importers():
@@ -236,10 +402,17 @@ def get_importers():
         start_date = datetime.strptime(start_date, '%Y-%m-%d')
         end_date = datetime.strptime(end_date, '%Y-%m-%d')
 
+        page_size, after = _get_page_args()
         importer_service = ImporterService()
-        importers = importer_service.get_importers_by_date_range(start_date, end_date)
+        importers, next_after = importer_service.get_importers_by_date_range(
+            start_date, end_date, page_size, after
+        )
 
-        return jsonify({'success': True, 'importers': importers}), 200
+        return jsonify({
+            'success': True,
+            'importers': importers,
+            'next_cursor': _next_cursor(next_after)
+        }), 200
     except ValueError as e:
         return jsonify({'success': False, 'message': str(e)}), 400
 
@@ -270,42 +443,27 @@ def get_import_lines(importer_id):
 @login_required
 def get_orders():
     from src.services.order import OrderService
-    from src.services.customer import CustomerService
-    
+
     order_service = OrderService()
-    customer_service = CustomerService()
-    
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    
-    if start_date and end_date:
-        orders = order_service.get_orders_by_date_range(start_date, end_date)
-    else:
-        orders = order_service.get_all_orders()
-    
-    # Enhance orders with customer names and total amounts
-    orders_dict = []
-    for order in orders:
-        order_dict = order.to_dict()
-        
-        # Add customer name
-        customer = customer_service.get_customer_by_id(order.customer_id)
-        order_dict['customer_name'] = customer.name if customer else 'Unknown Customer'
-        order_dict['total_lines'] = len(order.order_lines)
-        # Calculate total amount
-        order_lines = order.order_lines
-        total_amount = sum(float(line.gross_total_price) for line in order_lines) if order_lines else 0
-        order_dict['total_amount'] = total_amount
-        
-        # Format date for API
-        order_dict['order_date'] = order.order_at.isoformat() if order.order_at else None
-        order_dict['status'] = 'Pending' if order.status == 0 else 'Success'
-        
-        orders_dict.append(order_dict)
-    
+
+    try:
+        if _is_stream_requested():
+            orders = order_service.iter_order_summaries(start_date, end_date)
+            return stream_json_response(orders, envelope={'success': True}, key='orders')
+
+        page_size, after = _get_page_args()
+        orders, next_after = order_service.get_order_summaries(
+            start_date, end_date, page_size, after
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
     return jsonify({
         'success': True,
-        'orders': orders_dict
+        'orders': orders,
+        'next_cursor': _next_cursor(next_after)
     }), 200
 
 
@@ -360,5 +518,58 @@ def get_dashboard_metrics():
         }), 400
     
     metrics = dashboard_service.get_metrics(start_date, end_date)
-    print(metrics)
     return jsonify(metrics)
+
+
+@blueprint.route('/dashboard/top', methods=['GET'])
+@login_required
+def get_dashboard_top():
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not start_date or not end_date:
+        return jsonify({
+            'success': False,
+            'message': 'start_date and end_date are required'
+        }), 400
+
+    limit = request.args.get('limit', DASHBOARD_TOP_LIMIT, type=int)
+    limit = max(1, min(limit, DASHBOARD_TOP_MAX_LIMIT))
+    try:
+        top = dashboard_service.get_top(
+            start_date, end_date, metric=request.args.get('metric', 'revenue'), limit=limit,
+            approximate=_is_flag_set('approximate')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(top), 200
+
+
+@blueprint.route('/admin/db/pool', methods=['GET'])
+@login_required
+def get_db_pool_status():
+    return jsonify({
+        'success': True,
+        'pools': PostgresSession.pool_status()
+    }), 200
+
+
+@blueprint.route('/admin/db/queries', methods=['GET'])
+@login_required
+def get_db_query_stats():
+    stats = query_stats.stats()
+    if _is_flag_set('reset'):
+        query_stats.reset()
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        **stats
+    }), 200
+
+
+@blueprint.route('/admin/cache', methods=['GET'])
+@login_required
+def get_cache_stats():
+    return jsonify({
+        'success': True,
+        'caches': cache_stats()
+    }), 200
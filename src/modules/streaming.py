@@ -0,0 +1,41 @@
+from typing import Callable, Iterable
+
+from flask import Response, current_app, stream_with_context
+
+FLUSH_SIZE = 64 * 1024
+
+
+def stream_json_response(items: Iterable, serialize: Callable = None, envelope: dict = None,
+                         key: str = None, status: int = 200) -> Response:
+    """Stream `items` as a JSON array, encoding one element at a time.
+
+    :param items: Iterable of items, typically a repository stream
+    :param serialize: Converts one item into a JSON-serializable value
+    :param envelope: Fields of an enclosing JSON object; the array is written under `key`
+    :param key: Name of the array field in `envelope`
+    :param status: Response status code
+    :return: Flask streaming response
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        if envelope is None:
+            prefix, suffix = '[', ']'
+        else:
+            head = dumps(envelope)[:-1]
+            prefix = f'{head}{", " if envelope else ""}{dumps(key)}: ['
+            suffix = ']}'
+
+        buffer = [prefix]
+        size = 0
+        for index, item in enumerate(items):
+            chunk = dumps(serialize(item) if serialize else item)
+            buffer.append(f',{chunk}' if index else chunk)
+            size += len(chunk)
+            if size >= FLUSH_SIZE:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        buffer.append(suffix)
+        yield ''.join(buffer)
+
+    return Response(stream_with_context(generate()), status=status, mimetype='application/json')
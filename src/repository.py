@@ -1,30 +1,231 @@
+import csv
+import io
+import os
+from collections.abc import Mapping
+from datetime import date
+from functools import wraps
+from threading import Lock
+from typing import Optional
 from urllib.parse import urlparse
 
-from sqlalchemy import create_engine, delete, pool, select, text, tuple_
-from sqlalchemy.orm import joinedload, scoped_session, sessionmaker
+from sqlalchemy import (
+    ARRAY, cast, column, create_engine, delete, func, inspect, literal, or_, pool, select, text,
+    tuple_, update, values
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import joinedload, scoped_session, selectinload, sessionmaker
 
-from src.default import SQLALCHEMY_DATABASE_URI
-from src.helpers.collections_ import check_not_empty, flatten, is_sequence
+from src.default import (
+    KEY_LOOKUP_CHUNK_SIZE, SQLALCHEMY_DATABASE_URI, SQLALCHEMY_MAX_OVERFLOW, SQLALCHEMY_POOL_PRE_PING,
+    SQLALCHEMY_POOL_RECYCLE, SQLALCHEMY_POOL_SIZE, SQLALCHEMY_POOL_TIMEOUT
+)
+from src.helpers.collections_ import check_not_empty, chunked, flatten, is_sequence
+from src.helpers.query_stats import query_stats
+
+
+class MissingKeysError(LookupError):
+    """Some keys of a bulk write match no row"""
+
+    def __init__(self, message: str, keys: list):
+        super().__init__(message)
+        self.keys = keys
 
 
 class PostgresSession:
+    """Process-wide registry of engines and scoped sessions keyed by URI.
+
+    Every repository built for the same URI shares one pooled engine and one
+    thread-local session, so services instantiated per request reuse pooled
+    connections instead of opening a new one per query.
+    """
+    _engines = {}
+    _sessions = {}
+    _lock = Lock()
 
     @classmethod
-    def create_scoped_session(cls, pg_uri, poolclass=pool.NullPool):
+    def create_scoped_session(cls, pg_uri, poolclass=pool.QueuePool):
+        if session := cls._sessions.get(pg_uri):
+            return session
+
+        with cls._lock:
+            if pg_uri not in cls._sessions:
+                session_factory = sessionmaker(
+                    autoflush=False, bind=cls._get_engine(pg_uri, poolclass),
+                    expire_on_commit=False
+                )
+                cls._sessions[pg_uri] = scoped_session(session_factory)
+        return cls._sessions[pg_uri]
+
+    @classmethod
+    def get_engine(cls, pg_uri, poolclass=pool.QueuePool):
+        with cls._lock:
+            return cls._get_engine(pg_uri, poolclass)
+
+    @classmethod
+    def pool_status(cls):
+        """Return connection pool statistics of every registered engine."""
+        statuses = []
+        for engine in list(cls._engines.values()):
+            engine_pool = engine.pool
+            status = {
+                'uri': engine.url.render_as_string(hide_password=True),
+                'pool_class': type(engine_pool).__name__,
+                'pid': os.getpid()
+            }
+            if isinstance(engine_pool, pool.QueuePool):
+                status.update({
+                    'size': engine_pool.size(),
+                    'checked_in': engine_pool.checkedin(),
+                    'checked_out': engine_pool.checkedout(),
+                    'overflow': engine_pool.overflow(),
+                    'max_overflow': engine_pool._max_overflow
+                })
+            statuses.append(status)
+        return statuses
+
+    @classmethod
+    def remove_sessions(cls):
+        """Close the current thread's sessions and return their connections."""
+        for session in list(cls._sessions.values()):
+            session.remove()
+
+    @classmethod
+    def reset_after_fork(cls):
+        """Drop connections inherited from the parent process.
+
+        The child must never reuse the parent's sockets, so pooled connections
+        are discarded without being closed and thread-local sessions are
+        forgotten rather than closed.
+        """
+        for session in list(cls._sessions.values()):
+            session.registry.clear()
+        for engine in list(cls._engines.values()):
+            engine.dispose(close=False)
+
+    @classmethod
+    def _get_engine(cls, pg_uri, poolclass):
+        if engine := cls._engines.get(pg_uri):
+            return engine
+
+        pool_options = {}
+        if issubclass(poolclass, pool.QueuePool):
+            pool_options = {
+                'pool_size': SQLALCHEMY_POOL_SIZE,
+                'max_overflow': SQLALCHEMY_MAX_OVERFLOW,
+                'pool_timeout': SQLALCHEMY_POOL_TIMEOUT,
+                'pool_recycle': SQLALCHEMY_POOL_RECYCLE,
+                'pool_use_lifo': True
+            }
         engine = create_engine(
             pg_uri,
             echo=False,
             echo_pool=False,
             poolclass=poolclass,
-            client_encoding='utf-8'
-        )
-        session_factory = sessionmaker(
-            autoflush=False, bind=engine, expire_on_commit=False
+            pool_pre_ping=SQLALCHEMY_POOL_PRE_PING,
+            client_encoding='utf-8',
+            **pool_options
         )
-        return scoped_session(session_factory)
+        query_stats.instrument(engine)
+        cls._engines[pg_uri] = engine
+        return engine
+
+
+def _register_fork_hooks():
+    os.register_at_fork(after_in_child=PostgresSession.reset_after_fork)
+    try:
+        # uwsgi forks its workers from C, bypassing `os.register_at_fork`
+        from uwsgidecorators import postfork
+    except ImportError:
+        return
+    postfork(PostgresSession.reset_after_fork)
+
+
+_register_fork_hooks()
+
+
+class UnitOfWork:
+    """Batch every repository write of the current thread into one transaction.
+
+    Inside a unit of work, repository writes only flush; the outermost unit
+    commits once when it exits cleanly and rolls back otherwise. Nested units
+    join the outer transaction, and an error raised through a nested unit marks
+    the whole transaction for rollback. If a caller swallows that error, the
+    outermost unit still rolls back and raises a `RuntimeError` on exit, so the
+    discarded work is never reported as done.
+
+    Usable as a context manager in services and as a decorator on views::
+
+        with UnitOfWork():
+            ...
+
+        @UnitOfWork()
+        def view():
+            ...
+    """
+    DEPTH_KEY = 'unit_of_work_depth'
+    ROLLBACK_ONLY_KEY = 'unit_of_work_rollback_only'
+    AFTER_COMMIT_KEY = 'unit_of_work_after_commit'
+
+    def __init__(self, uri=None):
+        self.uri = uri or SQLALCHEMY_DATABASE_URI
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        session = self.session
+        session.info[self.DEPTH_KEY] = session.info.get(self.DEPTH_KEY, 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        session = self.session
+        if exc_type is not None:
+            session.info[self.ROLLBACK_ONLY_KEY] = True
+
+        session.info[self.DEPTH_KEY] -= 1
+        if session.info[self.DEPTH_KEY]:
+            return False
+
+        rollback_only = session.info.pop(self.ROLLBACK_ONLY_KEY, False)
+        callbacks = session.info.pop(self.AFTER_COMMIT_KEY, [])
+        del session.info[self.DEPTH_KEY]
+        if rollback_only:
+            session.rollback()
+            if exc_type is None:
+                raise RuntimeError('Unit of work marked rollback-only')
+            return False
+
+        try:
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+
+        for callback in callbacks:
+            callback()
+        return False
+
+    @property
+    def session(self):
+        return PostgresSession.create_scoped_session(self.uri)
+
+    @classmethod
+    def is_active(cls, session):
+        return session.info.get(cls.DEPTH_KEY, 0) > 0
 
 
 class PostgresRepository:
+    COPY_NULL = r'\N'
+    STATEMENT_OPTIONS = frozenset({'offset', 'limit', 'order_by', 'keyset', 'after', 'descending'})
+    QUERY_OPTIONS = STATEMENT_OPTIONS | {
+        'relationship', 'relationship_includes', 'relationship_excludes', 'relationship_loader'
+    }
+    RELATIONSHIP_LOADERS = {'joined': joinedload, 'selectin': selectinload}
+
     def __init__(self, uri=None):
         uri = uri or SQLALCHEMY_DATABASE_URI
         self._parse_uri(uri)
@@ -36,9 +237,58 @@ class PostgresRepository:
     def bulk_insert(self, entities: list):
         try:
             self.session.bulk_save_objects(entities, return_defaults=True)
-            self.commit()
+            self._flush_or_commit()
         except Exception as e:
-            self.rollback()
+            self._rollback_on_error()
+            raise e
+
+    def bulk_increment(self, model_class, key, field, deltas: dict, min_value=None) -> dict:
+        """Atomically add deltas to a numeric column in a single UPDATE ... FROM (VALUES ...)
+
+        :param model_class: The model class
+        :param key: The column identifying rows, e.g. `Product.id`
+        :param field: The numeric column to increment, e.g. `Product.stock_quantity`
+        :param deltas: Mapping of key value to the amount to add
+        :param min_value: Reject the whole batch if any decrement would bring `field`
+        below this value. Increments are never rejected.
+        :return: Mapping of key value to the new value of `field`
+        :raises MissingKeysError: Some keys match no row, given in its `keys`
+        :raises ValueError: Some decrements were rejected by `min_value`
+        """
+        if not deltas:
+            return {}
+
+        table = model_class.__table__
+        key_column, field_column = table.c[key.key], table.c[field.key]
+        increments = values(
+            column('key', key.type), column('delta', field.type), name='increments'
+        ).data(sorted(deltas.items()))
+        new_value = field_column + increments.c.delta
+
+        statement = update(table).where(key_column == increments.c.key)
+        if min_value is not None:
+            statement = statement.where(or_(increments.c.delta >= 0, new_value >= min_value))
+        changes = {field.key: new_value}
+        if 'updated_at' in table.c:
+            changes['updated_at'] = func.now()
+        statement = statement.values(changes).returning(key_column, field_column)
+
+        try:
+            result = dict(self.session.execute(statement).all())
+            if rejected := set(deltas) - set(result):
+                # Only on failure: tell missing rows apart from decrements below `min_value`
+                existing = set(self.session.execute(
+                    select(key_column).where(key_column.in_(rejected))
+                ).scalars())
+                if missing := sorted(rejected - existing):
+                    raise MissingKeysError(f'{model_class.__name__} {missing} not found', missing)
+                raise ValueError(
+                    f'{field.key} of {model_class.__name__} {sorted(rejected)} cannot go below {min_value}'
+                )
+            self._flush_or_commit()
+            return result
+        except Exception as e:
+            self._rollback_on_error()
             raise e
 
     def close(self):
@@ -47,24 +297,126 @@ class PostgresRepository:
     def commit(self):
         self.session.commit()
 
+    def copy_rows(self, table_name: str, columns, rows) -> int:
+        """Load rows into a table with COPY FROM STDIN within the current transaction
+
+        :param table_name: The target table
+        :param columns: The target column names, in the order of each row's values
+        :param rows: Iterable of value sequences; `None` is loaded as NULL
+        :return: The number of copied rows
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = 0
+        for row in rows:
+            writer.writerow([self.COPY_NULL if value is None else value for value in row])
+            count += 1
+        buffer.seek(0)
+
+        cursor = self.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table_name} ({', '.join(columns)}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '{self.COPY_NULL}')",
+                buffer
+            )
+        finally:
+            cursor.close()
+        return count
+
     def count(self, model_class):
         return self.session.query(model_class).count()
 
     def delete(self, model_class, *criterion):
         try:
             result = self.session.execute(delete(model_class).where(*criterion))
-            self.commit()
+            self._flush_or_commit()
             return result
         except Exception as e:
-            self.rollback()
+            self._rollback_on_error()
             raise e
 
     def execute(self, query: str, params: dict = None):
-        return self.session.execute(text(query), params).mappings().all()
+        result = self.session.execute(text(query), params)
+        return result.mappings().all() if result.returns_rows else []
 
     def find(self, model_class, *criterion, **kwargs):
         return self._query(model_class, *criterion, **kwargs).scalars().all()
 
+    def find_page(self, model_class_or_statement, *criterion, keyset, page_size: Optional[int],
+                  after=None, descending: bool = False, **kwargs):
+        """Find one page of results using keyset (seek) pagination
+
+        :param model_class_or_statement: A model class, or a `select()` run through `find_rows`
+        :param criterion: One or more SQL criterion
+        :param keyset: Columns uniquely ordering the results, e.g. `(Order.order_at, Order.id)`
+        :param page_size: The maximum number of returned items, all remaining items if `None`
+        :param after: Keyset values of the last item of the previous page
+        :param descending: Walk the keyset in descending order
+        :param kwargs: Other options, see `_query`
+        :return: Tuple of the items and the keyset values to request the next page with,
+        `None` on the last page
+        """
+        kwargs.update(keyset=keyset, after=after, descending=descending,
+                      limit=None if page_size is None else page_size + 1)
+        if self._is_mapped(model_class_or_statement):
+            items = self.find(model_class_or_statement, *criterion, **kwargs)
+        else:
+            items = self.find_rows(model_class_or_statement, *criterion, **kwargs)
+
+        if page_size is None or len(items) <= page_size:
+            return items, None
+
+        items = items[:page_size]
+        last = items[-1]
+        next_after = [
+            last[column.key] if isinstance(last, Mapping) else getattr(last, column.key)
+            for column in keyset
+        ]
+        return items, next_after
+
+    def find_projection(self, model_class, *criterion, fields=None, **kwargs) -> list:
+        """Select only the given columns and serialize them straight into dicts
+
+        No ORM entity is built, so there is no identity map, instrumentation or change
+        tracking to pay for. Meant for read-only listings.
+
+        :param model_class: The model class
+        :param criterion: One or more SQL criterion
+        :param fields: Column names to return, all columns if not specified
+        :param kwargs: Query options, see `_query`
+        :return: List of dicts, see `RowSerializer`
+        """
+        serializer = model_class.get_serializer(fields)
+        statement = self._build_statement(select(*serializer.columns), *criterion, **kwargs)
+        return [serializer(row) for row in self.session.execute(statement).tuples()]
+
+    def find_projection_page(self, model_class, *criterion, keyset, page_size: Optional[int],
+                             after=None, descending: bool = False, fields=None, **kwargs):
+        """`find_page` over `find_projection`; the keyset columns must be among `fields`
+
+        :return: Tuple of the dicts and the keyset values of the next page, `None` on the last page
+        """
+        kwargs.update(keyset=keyset, after=after, descending=descending,
+                      limit=None if page_size is None else page_size + 1)
+        items = self.find_projection(model_class, *criterion, fields=fields, **kwargs)
+        if page_size is None or len(items) <= page_size:
+            return items, None
+
+        items = items[:page_size]
+        return items, [items[-1][column.key] for column in keyset]
+
+    def find_rows(self, statement, *criterion, **kwargs):
+        """Run a column or aggregate select with the same criterion and options as `find`
+
+        :param statement: A `select()` statement
+        :param criterion: One or more SQL criterion
+        :param kwargs: offset, limit and order_by, see `_query`
+        :return: List of row mappings
+        """
+        statement = self._build_statement(statement, *criterion, **kwargs)
+        return self.session.execute(statement).mappings().all()
+
     def find_one(self, model_class, *criterion, **kwargs):
         kwargs['limit'] = 1
         return self._query(model_class, *criterion, **kwargs).scalar_one_or_none()
@@ -72,12 +424,62 @@ class PostgresRepository:
     def insert(self, entity):
         try:
             self.session.add(entity)
-            self.commit()
+            self._flush_or_commit()
             return entity
         except Exception as e:
-            self.rollback()
+            self._rollback_on_error()
+            raise e
+
+    def after_commit(self, callback):
+        """Run `callback` once the current unit of work commits, or right away outside of one.
+
+        Callbacks of a unit of work that rolls back are discarded.
+        """
+        if self.in_unit_of_work:
+            self.session.info.setdefault(UnitOfWork.AFTER_COMMIT_KEY, []).append(callback)
+        else:
+            callback()
+
+    def insert_values(self, model_class, rows: list, on_conflict=None, update_columns=None,
+                      returning=None) -> list:
+        """Insert many rows in a single multi-row INSERT, optionally handling conflicts
+
+        :param model_class: The model class
+        :param rows: List of dicts of column values
+        :param on_conflict: Conflict target columns or expressions, e.g. `[func.lower(Customer.name)]`.
+        Conflicting rows are skipped unless `update_columns` is given.
+        :param update_columns: Column names overwritten with the values of the conflicting row
+        :param returning: Columns to return for every inserted or updated row
+        :return: List of returned rows
+        """
+        if not rows:
+            return []
+
+        statement = pg_insert(model_class.__table__).values(rows)
+        if on_conflict is not None:
+            if update_columns:
+                statement = statement.on_conflict_do_update(
+                    index_elements=on_conflict,
+                    set_={column: statement.excluded[column] for column in update_columns}
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=on_conflict)
+        if returning is not None:
+            statement = statement.returning(*returning)
+
+        try:
+            result = self.session.execute(statement)
+            returned = result.all() if returning is not None else []
+            self._flush_or_commit()
+            return returned
+        except Exception as e:
+            self._rollback_on_error()
             raise e
 
+    @property
+    def in_unit_of_work(self):
+        return UnitOfWork.is_active(self.session)
+
     def find_by_composite_keys(self, model_class, keys, values, **kwargs):
         """Find model instances by composite keys
 
@@ -85,22 +487,89 @@ class PostgresRepository:
         :param keys: The list of keys
         :param values: The list of values
         """
+        return list(self.find_by_keys(model_class, keys, values, **kwargs).values())
+
+    def find_by_keys(self, model_class, keys, values, chunk_size: int = KEY_LOOKUP_CHUNK_SIZE,
+                     **kwargs) -> dict:
+        """Fetch many rows by (composite) key, binding the keys as one typed array per column
+
+        The statement text only depends on the key columns, so it is planned and cached
+        once however many keys are looked up. Keys are sent `chunk_size` at a time.
+
+        :param model_class: The model class
+        :param keys: The key columns, e.g. `[OrderLine.order_id, OrderLine.product_id]`
+        :param values: Key values: tuples in the order of `keys`, or scalars for a single key
+        :param chunk_size: The maximum number of keys bound per statement
+        :param kwargs: Query options, see `_query`
+        :return: Mapping of key tuple to model instance
+        """
         if not (isinstance(keys, (list, tuple, set)) and isinstance(values, (list, tuple, set))):
             raise ValueError('keys and values must be list, tuple or set')
+        if not keys:
+            raise ValueError('keys is required')
 
-        criterion = self._make_criterion(keys, values)
-        return self._query(model_class, criterion, **kwargs).scalars().all()
+        keys = list(keys)
+        key_tuples = {
+            tuple(value) if is_sequence(value) else (value,) for value in values
+        }
+        found = {}
+        for chunk in chunked(sorted(key_tuples), chunk_size):
+            criterion = self._make_criterion(keys, chunk)
+            for instance in self._query(model_class, criterion, **kwargs).unique().scalars():
+                found[tuple(getattr(instance, key.key) for key in keys)] = instance
+        return found
 
     def rollback(self):
         self.session.rollback()
 
+    def stream(self, model_class_or_statement, *criterion, batch_size: int = 1000, **kwargs):
+        """Iterate over results through a server-side cursor, `batch_size` rows at a time
+
+        Memory stays flat regardless of the result size. The session's connection is
+        busy until the generator is exhausted or closed.
+
+        :param model_class_or_statement: A model class, or a `select()` of columns
+        :param criterion: One or more SQL criterion
+        :param batch_size: The number of rows fetched per round trip
+        :param kwargs: Query options, see `_query`
+        :return: Generator of model instances, or of row mappings for statements
+        """
+        if self._is_mapped(model_class_or_statement):
+            statement = self._build_query(model_class_or_statement, *criterion, **kwargs)
+        else:
+            statement = self._build_statement(model_class_or_statement, *criterion, **kwargs)
+
+        result = self.session.execute(statement.execution_options(yield_per=batch_size))
+        try:
+            if self._is_mapped(model_class_or_statement):
+                yield from result.scalars()
+            else:
+                yield from result.mappings()
+        finally:
+            result.close()
+
+    def stream_projection(self, model_class, *criterion, fields=None, batch_size: int = 1000,
+                          **kwargs):
+        """`stream` over `find_projection`, `batch_size` rows per round trip
+
+        :return: Generator of dicts, see `RowSerializer`
+        """
+        serializer = model_class.get_serializer(fields)
+        statement = self._build_statement(select(*serializer.columns), *criterion, **kwargs)
+        result = self.session.execute(statement.execution_options(yield_per=batch_size))
+        try:
+            for row in result.tuples():
+                yield serializer(row)
+        finally:
+            result.close()
+
     def upsert(self, entity):
         try:
             result = self.session.merge(entity)
-            self.commit()
+            self._flush_or_commit()
             return result
         except Exception as e:
-            self.rollback()
+            self._rollback_on_error()
             raise e
 
     @staticmethod
@@ -113,14 +582,19 @@ class PostgresRepository:
                 query = query.filter(criteria)
         return query
 
-    @staticmethod
-    def _apply_query_options(query, **kwargs):
+    @classmethod
+    def _apply_query_options(cls, query, **kwargs):
         """Apply query options to given query"""
         offset = kwargs.get('offset')
         limit = kwargs.get('limit')
         order_by = kwargs.get('order_by')
+        keyset = kwargs.get('keyset')
 
-        if order_by is not None:
+        if keyset is not None:
+            query = cls._apply_keyset(
+                query, keyset, kwargs.get('after'), bool(kwargs.get('descending', False))
+            )
+        elif order_by is not None:
             if not is_sequence(order_by):
                 query = query.order_by(order_by)
             else:
@@ -133,26 +607,89 @@ class PostgresRepository:
             query = query.limit(limit)
         return query
 
-    @staticmethod
-    def _build_joined_relationships(model_class, relationship=None,
-                                    relationship_includes=None, relationship_excludes=None):
-        """Build joined relationships for given model class"""
-        joined = []
+    @classmethod
+    def _apply_keyset(cls, query, keyset, after, descending):
+        """Order by the keyset columns and seek past `after`
+
+        The leading column is also bounded on its own so that a single-column index
+        on it can limit the scan.
+        """
+        if after is not None:
+            if len(after) != len(keyset):
+                raise ValueError('Invalid cursor')
+
+            after = [
+                cls._coerce_keyset_value(column, value)
+                for column, value in zip(keyset, after)
+            ]
+            if descending:
+                query = query.filter(keyset[0] <= after[0], tuple_(*keyset) < tuple_(*after))
+            else:
+                query = query.filter(keyset[0] >= after[0], tuple_(*keyset) > tuple_(*after))
+
+        return query.order_by(*(column.desc() if descending else column.asc() for column in keyset))
+
+    @classmethod
+    def _build_relationship_loaders(cls, model_class, relationship=None, relationship_includes=None,
+                                    relationship_excludes=None, relationship_loader='joined'):
+        """Build relationship loader options for given model class"""
+        if relationship_loader not in cls.RELATIONSHIP_LOADERS:
+            raise ValueError(
+                f'relationship_loader must be one of {sorted(cls.RELATIONSHIP_LOADERS)}'
+            )
+
+        names = inspect(model_class).relationships.keys()
+        unknown = set(relationship_includes or ()) | set(relationship_excludes or ())
+        if unknown := sorted(unknown - set(names)):
+            raise ValueError(f'{model_class.__name__} has no relationships {unknown}')
+
         if relationship:
-            joined = [joinedload(getattr(model_class, key))
-                      for key in model_class.relationships().keys()]
+            keys = names
         elif relationship_includes:
-            joined = [joinedload(getattr(model_class, key)) for key in relationship_includes]
+            keys = relationship_includes
         elif relationship_excludes:
-            joined = [joinedload(getattr(model_class, key))
-                      for key in model_class.relationships().keys() if
-                      key not in relationship_excludes]
-        return joined
+            keys = [key for key in names if key not in relationship_excludes]
+        else:
+            keys = []
+
+        loader = cls.RELATIONSHIP_LOADERS[relationship_loader]
+        return [loader(getattr(model_class, key)) for key in keys]
+
+    def _flush_or_commit(self):
+        """Commit right away, or only flush when a unit of work owns the transaction"""
+        if self.in_unit_of_work:
+            self.session.flush()
+        else:
+            self.commit()
+
+    @classmethod
+    def _check_query_options(cls, kwargs, allowed=None):
+        """Reject misspelled or unsupported query options instead of silently ignoring them"""
+        if unknown := sorted(set(kwargs) - (allowed or cls.QUERY_OPTIONS)):
+            raise TypeError(f'Unknown query options: {", ".join(unknown)}')
+
+    @staticmethod
+    def _coerce_keyset_value(column, value):
+        """Convert a decoded cursor value back to the column's Python type"""
+        python_type = column.type.python_type
+        try:
+            if issubclass(python_type, date):
+                return python_type.fromisoformat(value)
+            return python_type(value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
 
     @staticmethod
     def _is_mapped(clazz):
         return hasattr(clazz, '__mapper__')
 
+    def _rollback_on_error(self):
+        """Roll back a failed write unless the enclosing unit of work will do it"""
+        if self.in_unit_of_work:
+            self.session.info[UnitOfWork.ROLLBACK_ONLY_KEY] = True
+        else:
+            self.rollback()
+
     def _parse_uri(self, uri):
         result = urlparse(uri)
         self.username = result.username
@@ -161,24 +698,33 @@ class PostgresRepository:
         self.port = result.port
 
     @staticmethod
-    def _make_criterion(keys, values):
-        """Makes PKs criteria for given model class and IDs"""
-        if not keys:
-            raise ValueError('keys is required')
+    def _make_criterion(keys, key_tuples):
+        """Makes a `keys IN (SELECT * FROM unnest(:array, ...))` criterion for the key tuples"""
+        arrays = [
+            cast(literal([key_tuple[index] for key_tuple in key_tuples]), ARRAY(key.type))
+            for index, key in enumerate(keys)
+        ]
+        key_table = func.unnest(*arrays).table_valued(
+            *(f'key_{index}' for index in range(len(keys)))
+        ).render_derived()
+        if len(keys) == 1:
+            return keys[0].in_(select(key_table.c.key_0))
+        return tuple_(*keys).in_(select(*key_table.c))
 
-        if len(keys) == 1:  # single PK
-            # handle string values and numeric values
-            if isinstance(values[0], str):
-                values_str = ', '.join(f"('{_}')" for _ in values)
-            else:
-                values_str = ', '.join(f"({_})" for _ in values)
-            return text(f'{keys[0].key} = ANY(VALUES {values_str})')
+    def _query(self, model_class, *criterion, **kwargs):
+        """ Execute the query statement built by `_build_query`"""
+        return self.session.execute(self._build_query(model_class, *criterion, **kwargs))
 
-        values_str = ', '.join(f'{str(tuple(_))}' for _ in values)
-        values_str = values_str.replace('"', "'")
-        return text(f'({tuple_(*keys)}) = ANY(VALUES {values_str})')
+    def _build_statement(self, statement, *criterion, **kwargs):
+        """ Apply criterion and query options to a column or aggregate select"""
+        self._check_query_options(kwargs, self.STATEMENT_OPTIONS)
+        if criterion:
+            statement = self._apply_filter_criteria(statement, criterion)
+        if kwargs:
+            statement = self._apply_query_options(statement, **kwargs)
+        return statement
 
-    def _query(self, model_class, *criterion, **kwargs):
+    def _build_query(self, model_class, *criterion, **kwargs):
         """ Create query statement for given model class
 
         :param model_class: Model class
@@ -187,12 +733,19 @@ class PostgresRepository:
             - offset: The offset
             - limit: The number of returned model instances
             - order_by: The SQL order_by criterion to sort results
+            - keyset: Columns to order by and seek on, replacing `order_by`
+            - after: Keyset values to seek past
+            - descending: Order the keyset descending. Defaults `False`.
             - relationship: Loading all model's relationships or not. Defaults `False`.
             Setting this option to `True` overwrites both `relationship_includes` and
             `relationship_excludes`
             - relationship_includes: Loading specific relationships list
             - relationship_excludes: Excludes loading specific relationships list
-        :return: Result
+            - relationship_loader: How the relationships are loaded, `joined` (the same
+            query, for many-to-one) or `selectin` (one extra query per relationship, for
+            collections). Defaults `joined`.
+        Unknown options raise TypeError.
+        :return: Select statement
         """
         check_not_empty(model_class)
         query = select(model_class)
@@ -200,18 +753,20 @@ class PostgresRepository:
         if not criterion and not kwargs:
             return query
 
+        self._check_query_options(kwargs)
         if kwargs and self._is_mapped(model_class):
-            # Build joined load options
-            relationship = bool(kwargs.get('relationship', False))
-            relationship_includes = kwargs.get('relationship_includes')
-            relationship_excludes = kwargs.get('relationship_excludes')
-            joined = self._build_joined_relationships(
-                model_class, relationship, relationship_includes, relationship_excludes)
-            query = query.options(*joined) if joined else query
+            loaders = self._build_relationship_loaders(
+                model_class,
+                relationship=bool(kwargs.get('relationship', False)),
+                relationship_includes=kwargs.get('relationship_includes'),
+                relationship_excludes=kwargs.get('relationship_excludes'),
+                relationship_loader=kwargs.get('relationship_loader', 'joined')
+            )
+            query = query.options(*loaders) if loaders else query
 
         if criterion:
             query = self._apply_filter_criteria(query, criterion)
 
         if kwargs:
             query = self._apply_query_options(query, **kwargs)
-        return self.session.execute(query)
+        return query
@@ -1,25 +1,81 @@
 from sqlalchemy import func
 
+from src.default import CUSTOMER_CACHE_SIZE, CUSTOMER_CACHE_TTL, DEFAULT_PAGE_SIZE
+from src.helpers.cache import TTLCache
 from src.models.customer import Customer
+from src.repository import UnitOfWork
 from src.services import BaseService
 
+customer_cache = TTLCache('customers', maxsize=CUSTOMER_CACHE_SIZE, ttl=CUSTOMER_CACHE_TTL)
+
 
 class CustomerService(BaseService):
     def __init__(self):
         super().__init__()
 
     def create_customer(self, name: str) -> Customer:
-        self.logger.info(f'Creating customer {name}')
-        if customer := self.get_customer_by_name(name=name):
-            return customer
+        return self.get_customer_by_id(self.resolve_customer_id(name))
+
+    def resolve_customer_id(self, name: str) -> int:
+        """
+        Get the id of the customer named `name`, creating the customer if needed
+        """
+        if not name or not name.strip():
+            raise ValueError('Customer name is required.')
+        return self.get_or_create_customers([name])[name]
+
+    def get_or_create_customers(self, names) -> dict:
+        """
+        Resolve many customer names at once. Names missing from the process-local cache are
+        resolved in one statement, which creates the missing customers and returns the id of
+        the existing ones. Their rows stay locked until the end of the transaction.
 
-        customer = Customer(name=name.lower())
-        return self.repo.upsert(customer)
+        Customers are unique by `LOWER(name)`, see `idx_customer_lower_name`, and new ones are
+        stored lowercased. Names are only normalized in SQL, with that same expression.
+        Returns a mapping of each given name to its customer id.
+        """
+        resolved = {}
+        missing = set()
+        for name in set(names):
+            if (customer_id := customer_cache.get(name)) is not None:
+                resolved[name] = customer_id
+            else:
+                missing.add(name)
+        if not missing:
+            return resolved
+
+        self.logger.info(f'Resolving {len(missing)} customers')
+        with UnitOfWork():
+            rows = self.repo.execute("""
+                WITH given AS (
+                    SELECT name, LOWER(name) AS lower_name FROM unnest(CAST(:names AS TEXT[])) AS name
+                ), upserted AS (
+                    INSERT INTO customer AS c (name)
+                    SELECT DISTINCT lower_name FROM given ORDER BY lower_name
+                    ON CONFLICT (LOWER(name)) DO UPDATE SET name = c.name
+                    RETURNING id, LOWER(name) AS lower_name
+                )
+                SELECT g.name, u.id FROM given g JOIN upserted u ON u.lower_name = g.lower_name
+            """, {'names': sorted(missing)})
+            found = {row['name']: row['id'] for row in rows}
+            self.repo.after_commit(lambda: customer_cache.set_many(found))
+        resolved.update(found)
+        return resolved
 
     def get_all_customers(self) -> list[Customer]:
         self.logger.info('Getting all customers')
         return self.repo.get_all(Customer)
 
+    def iter_customers(self):
+        self.logger.info('Streaming all customers')
+        return self.repo.stream_projection(Customer, order_by=Customer.id)
+
+    def get_customers_page(self, page_size: int = DEFAULT_PAGE_SIZE, after=None):
+        self.logger.info('Getting customers page')
+        return self.repo.find_projection_page(
+            Customer, keyset=(Customer.id,), page_size=page_size, after=after
+        )
+
     def get_customer_by_name(self, name: str) -> Customer:
         self.logger.info(f'Getting user {name}')
         return self.repo.find_one(Customer, func.lower(Customer.name) == name.lower())
@@ -1,46 +1,140 @@
 from functools import cached_property
 
-from datetime import datetime
+from datetime import date, datetime
+from typing import Iterable
 from sqlalchemy import func, and_
+from src.default import DASHBOARD_SKETCH_CAPACITY, METRICS_CACHE_SIZE, METRICS_CACHE_TTL
+from src.helpers.cache import TTLCache
 from src.models import Order, OrderLine, Product, Importer, ImportLine
 
+metrics_cache = TTLCache('dashboard_metrics', maxsize=METRICS_CACHE_SIZE, ttl=METRICS_CACHE_TTL)
+
+STATS_KEY = 'stats'
+
+
 class DashboardService:
 
     @cached_property
-    def order_service(self):
-        from src.services.order import OrderService
-        return OrderService()
+    def rollup_service(self):
+        from src.services.rollup import RollupService
+        return RollupService()
 
     @cached_property
-    def importer_service(self):
-        from src.services.importer import ImporterService
-        return ImporterService()
+    def user_service(self):
+        from src.services.user import UserService
+        return UserService()
+
+    @staticmethod
+    def invalidate_dates(dates: Iterable[date]):
+        """
+        Drop the cached metrics of every range containing one of `dates`, and the counters.
+        Other processes notice orders and imports from the rollup version of their day, see
+        `_get_or_compute`. Products are not tracked by it, so a product count changed outside
+        the app shows up once the counters expire after `METRICS_CACHE_TTL`.
+        """
+        dates = {day.date() if isinstance(day, datetime) else day for day in dates}
+        metrics_cache.invalidate(STATS_KEY)
+        metrics_cache.invalidate_where(
+            lambda key: key != STATS_KEY and any(key[0] <= day <= key[1] for day in dates)
+        )
+
+    def get_stats(self):
+        """
+        Get the total number of products, imports and orders
+        """
+        # Any order or import bumps the version of its day, so check the whole history
+        return self._get_or_compute(STATS_KEY, date.min, date.max, lambda: {
+            'totalProducts': self.user_service.get_total_products(),
+            'totalImports': self.user_service.get_total_imports(),
+            'totalOrders': self.user_service.get_total_orders()
+        })
 
     def get_metrics(self, start_date: str, end_date: str):
         """
         Get dashboard metrics for the specified date range
         """
         try:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            end = end.replace(hour=23, minute=59, second=59)
-
-            # Get total sales
-            sales_metrics = self.order_service.get_sales_metrics(start, end)
-            
-            # Get total imports
-            import_metrics = self.importer_service.get_import_metrics(start, end)
-
-            return {
-                "success": True,
-                "metrics": {
-                    "sales": sales_metrics,
-                    "imports": import_metrics
-                }
-            }
+            start = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end = datetime.strptime(end_date, '%Y-%m-%d').date()
+            return self._get_or_compute((start, end), start, end, lambda: self._compute_metrics(start, end))
         except Exception as e:
             return {
                 "success": False,
                 "message": str(e)
             }
-            
\ No newline at end of file
+
+    def get_top(self, start_date: str, end_date: str, metric: str = 'revenue', limit: int = 10,
+                approximate: bool = False) -> dict:
+        """
+        Get the best-selling products, the top customers by `metric` and the slow movers
+        over a date range, from the daily rollups.
+
+        With `approximate`, products and customers are ranked from the top sketches stored
+        per day by the rollup job, see `RollupService.get_approximate_top`. Each item then
+        carries the total it is guaranteed to reach and the `error` it may be short of its
+        true total by. Profit cannot be sketched, its daily values can be negative.
+
+        :param metric: `quantity`, `revenue` or `profit`
+        :param limit: Number of items of each list, at most the sketch capacity when approximate
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        if start > end:
+            raise ValueError('start_date must not be after end_date')
+        if metric not in self.rollup_service.TOP_METRICS:
+            raise ValueError(f'metric must be one of {", ".join(self.rollup_service.TOP_METRICS)}')
+        if approximate:
+            if metric not in self.rollup_service.SKETCH_METRICS:
+                raise ValueError(
+                    f'Approximate top is only available for {" and ".join(self.rollup_service.SKETCH_METRICS)}'
+                )
+            limit = min(limit, DASHBOARD_SKETCH_CAPACITY)
+
+        return self._get_or_compute(
+            (start, end, 'top', metric, limit, approximate), start, end,
+            lambda: self._compute_top(start, end, metric, limit, approximate)
+        )
+
+    def _get_or_compute(self, key, start: date, end: date, compute):
+        """
+        Return the cached value of `key` unless the rollups from `start` to `end` changed
+        since it was computed, in this process or in another one such as the order worker
+        """
+        # Read before computing, so a change committed in between makes the entry stale
+        version = self.rollup_service.get_version(start, end)
+        cached = metrics_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if cached is not None:
+            metrics_cache.invalidate(key)
+
+        value = compute()
+        metrics_cache.set(key, (version, value))
+        return value
+
+    def _compute_top(self, start: date, end: date, metric: str, limit: int, approximate: bool):
+        get_top = self.rollup_service.get_approximate_top if approximate else self.rollup_service.get_top
+        return {
+            'success': True,
+            'approximate': approximate,
+            'top': {
+                'products': get_top('products', metric, start, end, limit),
+                'customers': get_top('customers', metric, start, end, limit),
+                'slow_movers': self.rollup_service.get_slow_movers(start, end, limit)
+            }
+        }
+
+    def _compute_metrics(self, start: date, end: date):
+        # Get total sales
+        sales_metrics = self.rollup_service.get_sales_metrics(start, end)
+
+        # Get total imports
+        import_metrics = self.rollup_service.get_import_metrics(start, end)
+
+        return {
+            "success": True,
+            "metrics": {
+                "sales": sales_metrics,
+                "imports": import_metrics
+            }
+        }
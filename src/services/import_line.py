@@ -18,4 +18,6 @@ class ImportLineService(BaseService):
         return import_lines
 
     def get_import_lines_by_importer_id(self, importer_id: int):
-        return self.repo.find(ImportLine, ImportLine.importer_id == importer_id)
+        return self.repo.find(
+            ImportLine, ImportLine.importer_id == importer_id, relationship_includes=['product']
+        )
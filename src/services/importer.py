@@ -1,10 +1,13 @@
 from functools import cached_property
 from datetime import datetime
 
-from sqlalchemy import and_
+from sqlalchemy import and_, func, select
 
-from src.models import Importer
+from src.default import DEFAULT_PAGE_SIZE
+from src.models import Importer, ImportLine
+from src.repository import UnitOfWork
 from src.services import BaseService
+from src.services.dashboard import DashboardService
 
 
 class ImporterService(BaseService):
@@ -21,6 +24,16 @@ class ImporterService(BaseService):
         from src.services.product import ProductService
         return ProductService()
 
+    @cached_property
+    def rollup_service(self):
+        from src.services.rollup import RollupService
+        return RollupService()
+
+    @cached_property
+    def stock_service(self):
+        from src.services.stock import StockService
+        return StockService()
+
     def create_importer(self, importer_dict: dict) -> Importer:
         if not importer_dict:
             raise ValueError('importer_dict is required')
@@ -28,6 +41,7 @@ class ImporterService(BaseService):
         importer = Importer(**importer_dict)
         return self.repo.upsert(importer)
 
+    @UnitOfWork()
     def create_importer_from_request(self, data, current_user):
         import_lines = data['import_lines']
         if not import_lines:
@@ -58,66 +72,56 @@ class ImporterService(BaseService):
         import_lines = self._process_import_lines(import_lines_mapped, importer)
         importer.status = Importer.STATUS_SUCCESS
         self.update_importer(importer)
+        self.rollup_service.apply_importers([importer.id])
+        self.stock_service.record_importers([importer.id])
+        self.repo.after_commit(lambda: DashboardService.invalidate_dates([importer.imported_at]))
         return importer, import_lines
 
-    def get_importers_by_date_range(self, start_date: datetime, end_date: datetime):
+    def get_importers_by_date_range(self, start_date: datetime, end_date: datetime,
+                                    page_size: int = DEFAULT_PAGE_SIZE, after=None):
+        """
+        Get a page of importers, newest first, with line count, total quantity and total cost
+        in one aggregated query. Returns the summaries and the keyset of the next page.
+        """
         if not start_date or not end_date:
             raise ValueError('Start date and end date are required!')
 
-        importers = self.repo.find(
-            Importer, and_(
+        rows, next_after = self.repo.find_page(
+            self._importer_summary_statement(), and_(
                 Importer.imported_at >= start_date,
                 Importer.imported_at <= end_date
             ),
-            order_by=Importer.imported_at.desc()
+            keyset=(Importer.imported_at, Importer.id), page_size=page_size, after=after,
+            descending=True
+        )
+        return [self._to_importer_summary(row) for row in rows], next_after
+
+    @staticmethod
+    def _importer_summary_statement():
+        return (
+            select(
+                *Importer.__table__.columns,
+                func.count(ImportLine.product_id).label('total_lines'),
+                func.coalesce(func.sum(ImportLine.quantity), 0).label('total_quantity'),
+                func.coalesce(func.sum(ImportLine.total_price), 0).label('total_cost')
+            )
+            .select_from(Importer)
+            .outerjoin(ImportLine, ImportLine.importer_id == Importer.id)
+            .group_by(Importer.id)
         )
 
-        # sort by imported_at descending
-        importers.sort(key=lambda x: x.imported_at, reverse=True)
-
-        processed_importers = []
-        for importer in importers:
-            importer_dict = importer.to_dict()
-            importer_dict['imported_at'] = importer_dict['imported_at'].strftime('%Y-%m-%d')
-            importer_dict['total_lines'] = len(importer.import_lines)
-            importer_dict['other_expenses'] = int(importer_dict['other_expenses'])
-            importer_dict['status'] = 'Pending' if importer.status == 0 else 'Success'
-            processed_importers.append(importer_dict)
-
-        return processed_importers
+    @staticmethod
+    def _to_importer_summary(row) -> dict:
+        summary = dict(row)
+        summary['imported_at'] = summary['imported_at'].strftime('%Y-%m-%d')
+        summary['other_expenses'] = int(summary['other_expenses'] or 0)
+        summary['total_cost'] = int(summary['total_cost'])
+        summary['status'] = 'Pending' if summary['status'] == Importer.STATUS_PENDING else 'Success'
+        return summary
 
     def update_importer(self, importer: Importer) -> Importer:
         return self.repo.upsert(importer)
 
-    def get_import_metrics(self, start_date: datetime, end_date: datetime):
-        """
-        Get importer metrics for a given date range
-        """
-        query = """
-            SELECT 
-                i.imported_at,
-                SUM(il.quantity) as total_quantity,
-                SUM(il.quantity * il.unit_price) as total_cost
-            FROM import_line il
-            JOIN importer i ON il.importer_id = i.id
-            WHERE i.imported_at >= :start_date AND i.imported_at <= :end_date
-            GROUP BY i.imported_at
-        """
-        results  = self.repo.execute(query, {'start_date': start_date, 'end_date': end_date})
-        transformed_results = {
-            'total_quantity': 0,
-            'total_cost': 0,
-            'import_at_list': []
-        }
-        for result in results:
-            result = dict(result)
-            result['imported_at'] = result['imported_at'].strftime('%Y-%m-%d')
-            result['total_cost'] = float(result['total_cost'])
-            transformed_results['total_quantity'] += result['total_quantity']
-            transformed_results['total_cost'] += result['total_cost']
-            transformed_results['import_at_list'].append(result)
-        return transformed_results
-
     def _process_import_lines(self, import_lines_mapped: dict, importer: Importer):
         import_lines_dict = []
         for product_id, import_line in import_lines_mapped.items():
@@ -139,5 +143,6 @@ class ImporterService(BaseService):
             raise ValueError('No any records to import! Please check your input data.')
 
         import_lines = self.import_line_service.create_import_lines(import_lines_dict) or []
+        self.product_service.update_average_costs(import_lines)
         self.product_service.update_stock_quantity_from_import_lines(import_lines)
         return import_lines
@@ -1,9 +1,16 @@
+import re
+from collections import Counter
 from functools import cached_property
 from datetime import datetime
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, select
 
+from src.default import ALLOW_NEGATIVE_STOCK, DEFAULT_PAGE_SIZE
+from src.models.customer import Customer
 from src.models.order import Order
+from src.models.order_line import OrderLine
+from src.repository import UnitOfWork
 from src.services import BaseService
+from src.services.dashboard import DashboardService
 
 
 class OrderService(BaseService):
@@ -25,6 +32,16 @@ class OrderService(BaseService):
         from src.services.product import ProductService
         return ProductService()
 
+    @cached_property
+    def rollup_service(self):
+        from src.services.rollup import RollupService
+        return RollupService()
+
+    @cached_property
+    def stock_service(self):
+        from src.services.stock import StockService
+        return StockService()
+
     def create_order(self, order_dict: dict) -> Order:
         if not order_dict:
             raise ValueError('order_dict is required')
@@ -32,6 +49,7 @@ class OrderService(BaseService):
         order = Order(**order_dict)
         return self.repo.upsert(order)
 
+    @UnitOfWork()
     def create_order_from_request(self, data, current_user):
         # Extract customer information
         customer_data = data['customer']
@@ -40,14 +58,13 @@ class OrderService(BaseService):
 
         # Check if customer is new or existing
         if 'id' in customer_data:
-            customer_id = customer_data['id']
+            customer_id = self.parse_customer_id(customer_data['id'])
         else:
             # Create a new customer if name is provided
             customer_name = customer_data.get('name')
             if not customer_name:
                 raise ValueError('Customer name is required for new customers.')
-            customer = self.customer_service.create_customer(name=customer_name)
-            customer_id = customer.id
+            customer_id = self.customer_service.resolve_customer_id(customer_name)
 
         # Create the order
         order = self.create_order({
@@ -86,9 +103,194 @@ class OrderService(BaseService):
         order_lines = self._process_order_lines(order_lines_dict, order)
         order.status = Order.STATUS_SUCCESS
         self.update_order(order)
+        self.rollup_service.apply_orders([order.id])
+        self.stock_service.record_orders([order.id])
+        self.repo.after_commit(lambda: DashboardService.invalidate_dates([order.order_at]))
 
         return order, order_lines
 
+    @UnitOfWork()
+    def create_orders_batch(self, orders_data: list, current_user) -> list:
+        """
+        Create many orders in one transaction with a fixed number of statements: customers are
+        resolved in bulk, orders and lines are inserted with multi-row INSERTs and stock is
+        adjusted once. An invalid order is reported and skipped without affecting the others.
+
+        :return: One result per submitted order, in the submitted order
+        """
+        self.logger.info(f'Creating a batch of {len(orders_data)} orders')
+        results = [None] * len(orders_data)
+        pending = {}
+        for index, data in enumerate(orders_data):
+            try:
+                self.validate_order_request(data)
+                lines = [line for line in data['order_lines'] if line['quantity'] > 0]
+                if len({line['product_id'] for line in lines}) < len(lines):
+                    raise ValueError('A product can only appear once per order.')
+                pending[index] = (data, lines)
+            except (TypeError, ValueError) as e:
+                results[index] = {'index': index, 'success': False, 'message': str(e)}
+
+        # Customers are only created for orders that passed every check
+        self._check_batch_customers(pending, results)
+        self._check_batch_products(pending, results)
+        if not pending:
+            return results
+        customer_ids = self._resolve_batch_customers(pending)
+
+        order_ids = self.repo.execute(
+            "SELECT nextval(pg_get_serial_sequence('public.order', 'id')) AS id "
+            "FROM generate_series(1, :count)", {'count': len(pending)}
+        )
+        orders, order_lines = [], []
+        for (index, (data, lines)), row in zip(pending.items(), order_ids):
+            order_at = datetime.strptime(data['ordered_date'], '%Y-%m-%d').date()
+            orders.append({
+                'id': row['id'],
+                'order_at': order_at,
+                'created_by': current_user.id,
+                'customer_id': customer_ids[index],
+                'status': Order.STATUS_SUCCESS
+            })
+            for line in lines:
+                discount = line.get('discount', 0)
+                order_lines.append({
+                    'order_id': row['id'],
+                    'product_id': line['product_id'],
+                    'quantity': line['quantity'],
+                    'sale_price': line['sale_price'],
+                    'discount': discount,
+                    'net_total_price': line['sale_price'] * line['quantity'] - discount,
+                    'gross_total_price': line['sale_price'] * line['quantity'],
+                    'unit_cost': line['unit_cost']
+                })
+            results[index] = {'index': index, 'success': True, 'order_id': row['id']}
+
+        self.repo.insert_values(Order, orders)
+        self.repo.insert_values(OrderLine, order_lines)
+        deltas = Counter()
+        for line in order_lines:
+            deltas[line['product_id']] -= line['quantity']
+        self.product_service.adjust_stock_quantities(deltas, allow_negative=ALLOW_NEGATIVE_STOCK)
+
+        order_ids = [order['id'] for order in orders]
+        self.rollup_service.apply_orders(order_ids)
+        self.stock_service.record_orders(order_ids)
+        order_dates = {order['order_at'] for order in orders}
+        self.repo.after_commit(lambda: DashboardService.invalidate_dates(order_dates))
+        return results
+
+    def _check_batch_customers(self, pending: dict, results: list):
+        """Fail orders of customer ids that do not exist"""
+        ids = {
+            self.parse_customer_id(data['customer']['id'])
+            for data, _ in pending.values() if 'id' in data['customer']
+        }
+        if not ids:
+            return
+
+        known_ids = {customer.id for customer in self.repo.find(Customer, Customer.id.in_(ids))}
+        for index, (data, _) in list(pending.items()):
+            customer_data = data['customer']
+            if 'id' in customer_data and self.parse_customer_id(customer_data['id']) not in known_ids:
+                del pending[index]
+                results[index] = {
+                    'index': index, 'success': False,
+                    'message': f'Customer {customer_data["id"]} does not exist.'
+                }
+
+    def _resolve_batch_customers(self, pending: dict) -> dict:
+        """Map each pending order to its customer id, creating the new customers by name in bulk"""
+        names = [data['customer']['name'] for data, _ in pending.values() if 'id' not in data['customer']]
+        name_ids = self.customer_service.get_or_create_customers(names)
+
+        customer_ids = {}
+        for index, (data, _) in pending.items():
+            customer_data = data['customer']
+            if 'id' in customer_data:
+                customer_ids[index] = self.parse_customer_id(customer_data['id'])
+            else:
+                customer_ids[index] = name_ids[customer_data['name']]
+        return customer_ids
+
+    def _check_batch_products(self, pending: dict, results: list):
+        """
+        Fail orders of unknown products and, when negative stock is not allowed, orders that
+        the remaining stock cannot cover, allocating stock in submission order. Lines of the
+        remaining orders get the current unit cost of their product.
+        """
+        product_ids = {line['product_id'] for _, lines in pending.values() for line in lines}
+        if not product_ids:
+            return
+
+        products = self.product_service.get_stock_and_costs(product_ids, for_update=not ALLOW_NEGATIVE_STOCK)
+        stock = {product_id: product['stock_quantity'] for product_id, product in products.items()}
+        for index, (_, lines) in list(pending.items()):
+            if unknown := [line['product_id'] for line in lines if line['product_id'] not in stock]:
+                message = f'Products {unknown} do not exist.'
+            elif not ALLOW_NEGATIVE_STOCK and any(
+                line['quantity'] > stock[line['product_id']] for line in lines
+            ):
+                message = 'Not enough stock to fulfill the order.'
+            else:
+                for line in lines:
+                    stock[line['product_id']] -= line['quantity']
+                    line['unit_cost'] = products[line['product_id']]['unit_cost']
+                continue
+
+            del pending[index]
+            results[index] = {'index': index, 'success': False, 'message': message}
+
+    @staticmethod
+    def validate_order_request(data):
+        """
+        Check an order request without touching the database, raising ValueError when invalid
+        """
+        if not data or 'customer' not in data or 'order_lines' not in data:
+            raise ValueError('Invalid data provided')
+
+        customer_data = data['customer']
+        if not customer_data:
+            raise ValueError('Customer data is required.')
+        if not isinstance(customer_data, dict):
+            raise ValueError('Customer data must be an object.')
+        if 'id' in customer_data:
+            OrderService.parse_customer_id(customer_data['id'])
+        elif not isinstance(customer_data.get('name'), str) or not customer_data['name'].strip():
+            raise ValueError('Customer name is required for new customers.')
+
+        try:
+            datetime.strptime(data.get('ordered_date') or '', '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError('A valid ordered date (YYYY-MM-DD) is required.')
+
+        valid_lines = 0
+        for line in data['order_lines']:
+            if 'product_id' not in line or 'quantity' not in line or 'sale_price' not in line:
+                raise ValueError('Product ID, quantity, and sale price are required for each order line.')
+            if line['quantity'] is None or line['sale_price'] is None:
+                raise ValueError('Quantity and sale price are required')
+            if line['quantity'] <= 0:
+                continue
+            if line['sale_price'] <= 0:
+                raise ValueError('Sale price must be greater than 0')
+            valid_lines += 1
+
+        if not valid_lines:
+            raise ValueError('No valid order lines to process.')
+
+    @staticmethod
+    def parse_customer_id(value) -> int:
+        """
+        Read a customer id given as an integer or a string of an integer, raising ValueError otherwise
+        """
+        if isinstance(value, str) and re.fullmatch(r'\s*-?\d+\s*', value):
+            value = int(value)
+        # Customer ids are INTEGER keys, the anonymous customer is -1
+        if isinstance(value, int) and not isinstance(value, bool) and -2 ** 31 <= value < 2 ** 31:
+            return value
+        raise ValueError(f'Invalid customer id {value!r}.')
+
     def update_order(self, order: Order) -> Order:
         return self.repo.upsert(order)
 
@@ -107,6 +309,12 @@ class OrderService(BaseService):
             if order_line['quantity'] == 0:
                 continue
 
+        products = self.product_service.get_stock_and_costs(line['product_id'] for line in order_lines)
+        if unknown := [line['product_id'] for line in order_lines if line['product_id'] not in products]:
+            raise ValueError(f'Products {unknown} do not exist.')
+        for order_line in order_lines:
+            order_line['unit_cost'] = products[order_line['product_id']]['unit_cost']
+
         order_lines = self.order_line_service.create_order_lines(order_lines)
         self.product_service.update_stock_quantity_from_order_lines(order_lines)
         return order_lines
@@ -138,45 +346,66 @@ class OrderService(BaseService):
             self.logger.error(f"Error fetching orders by date range: {e}")
             return []
 
+    def get_order_summaries(self, start_date=None, end_date=None,
+                            page_size: int = DEFAULT_PAGE_SIZE, after=None):
+        """
+        Get a page of orders, newest first, with customer name, line count and gross total
+        in one aggregated query. Returns the summaries and the keyset of the next page.
+        """
+        rows, next_after = self.repo.find_page(
+            self._order_summary_statement(),
+            *self._order_date_criterion(start_date, end_date),
+            keyset=(Order.order_at, Order.id), page_size=page_size, after=after, descending=True
+        )
+        return [self._to_order_summary(row) for row in rows], next_after
+
+    def iter_order_summaries(self, start_date=None, end_date=None):
+        """
+        Stream every order summary, newest first, through a server-side cursor
+        """
+        rows = self.repo.stream(
+            self._order_summary_statement(),
+            *self._order_date_criterion(start_date, end_date),
+            keyset=(Order.order_at, Order.id), descending=True
+        )
+        return (self._to_order_summary(row) for row in rows)
+
     def get_order_by_id(self, order_id):
         """
         Get a single order by ID
         """
         return self.repo.find_one(Order, Order.id == order_id)
 
-    def get_sales_metrics(self, start_date, end_date):
-        """
-        Get sales metrics for a given date range
-        """
-        # Get total quantity and total revenue and calculate total cost
-        query = """
-            SELECT 
-                o.order_at,
-                SUM(ol.quantity) as total_quantity,
-                SUM(ol.quantity * ol.sale_price) as total_revenue,
-                SUM(ol.quantity * ol.sale_price) - SUM(ol.quantity * p.unit_price) - SUM(ol.discount) as total_profit
-            FROM order_line ol
-            JOIN "order" o ON ol.order_id = o.id
-            JOIN product p ON ol.product_id = p.id
-            WHERE o.order_at >= :start_date AND o.order_at <= :end_date
-            GROUP BY o.order_at
-        """
-        results = self.repo.execute(query, {'start_date': start_date, 'end_date': end_date})
-        # results is total quantity and total revenue for all and grouped by order_at
-        transformed_results = {
-            'total_quantity': 0,
-            'total_revenue': 0,
-            'total_profit': 0,
-            'order_at_list': []
-        }
-        for result in results:
-            result = dict(result)
-            result['order_at'] = result['order_at'].strftime('%Y-%m-%d')
-            result['total_revenue'] = float(result['total_revenue'])
-            result['total_profit'] = float(result['total_profit'])
-            transformed_results['total_quantity'] += result['total_quantity']
-            transformed_results['total_revenue'] += result['total_revenue']
-            transformed_results['total_profit'] += result['total_profit']
-            transformed_results['order_at_list'].append(result)
-        
-        return transformed_results
\ No newline at end of file
+    @staticmethod
+    def _order_date_criterion(start_date, end_date) -> list:
+        if not (start_date and end_date):
+            return []
+
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        if isinstance(end_date, str):
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        return [and_(Order.order_at >= start_date, Order.order_at <= end_date)]
+
+    @staticmethod
+    def _order_summary_statement():
+        return (
+            select(
+                *Order.__table__.columns,
+                func.coalesce(Customer.name, 'Unknown Customer').label('customer_name'),
+                func.count(OrderLine.product_id).label('total_lines'),
+                func.coalesce(func.sum(OrderLine.gross_total_price), 0).label('total_amount')
+            )
+            .select_from(Order)
+            .outerjoin(Customer, Customer.id == Order.customer_id)
+            .outerjoin(OrderLine, OrderLine.order_id == Order.id)
+            .group_by(Order.id, Customer.id)
+        )
+
+    @staticmethod
+    def _to_order_summary(row) -> dict:
+        summary = dict(row)
+        summary['total_amount'] = float(summary['total_amount'])
+        summary['order_date'] = summary['order_at'].isoformat() if summary['order_at'] else None
+        summary['status'] = 'Pending' if summary['status'] == Order.STATUS_PENDING else 'Success'
+        return summary
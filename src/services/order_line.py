@@ -28,7 +28,7 @@ class OrderLineService(BaseService):
             order_lines = self.repo.find(
                 OrderLine,
                 OrderLine.order_id == order_id,
-                eager_load=['product']
+                relationship_includes=['product']
             )
             
             # Enhance order lines with product information
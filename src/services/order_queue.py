@@ -0,0 +1,158 @@
+from functools import cached_property
+from typing import List, Tuple
+
+from sqlalchemy import and_
+from sqlalchemy.exc import DataError, IntegrityError
+
+from src.default import (
+    ORDER_QUEUE_BATCH_SIZE, ORDER_QUEUE_MAX_ATTEMPTS, ORDER_QUEUE_VISIBILITY_TIMEOUT
+)
+from src.models.order_queue import OrderQueue
+from src.repository import UnitOfWork
+from src.services import BaseService
+
+
+class OrderQueueService(BaseService):
+    """Postgres-backed queue of submitted orders, deduplicated by idempotency key.
+
+    Jobs are claimed with `FOR UPDATE SKIP LOCKED`, so any number of workers can drain
+    the queue concurrently. A job is marked successful in the same transaction that
+    creates its order, and a claimed job whose worker died becomes claimable again
+    after `ORDER_QUEUE_VISIBILITY_TIMEOUT` seconds.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @cached_property
+    def order_service(self):
+        from src.services.order import OrderService
+        return OrderService()
+
+    @cached_property
+    def user_service(self):
+        from src.services.user import UserService
+        return UserService()
+
+    def enqueue(self, data: dict, current_user, idempotency_key: str) -> Tuple[OrderQueue, bool]:
+        """
+        Validate an order request and queue it. Returns the job and whether it was created,
+        or the existing job when the idempotency key was already submitted.
+        """
+        self.order_service.validate_order_request(data)
+        return self._add_job(data, current_user, idempotency_key, OrderQueue.STATUS_QUEUED)
+
+    @UnitOfWork()
+    def create_order_once(self, data: dict, current_user, idempotency_key: str):
+        """
+        Create an order right away unless the idempotency key was already submitted.
+        Concurrent duplicates wait on the key's unique index and then see the first job.
+        Returns the job and the created order lines, `None` for a duplicate submission.
+        """
+        job, created = self._add_job(data, current_user, idempotency_key, OrderQueue.STATUS_PROCESSING)
+        if not created:
+            return job, None
+
+        order, order_lines = self.order_service.create_order_from_request(data, current_user)
+        self._mark_success(job, order.id)
+        return job, order_lines
+
+    def get_job(self, job_id: int, current_user) -> OrderQueue:
+        return self.repo.find_one(
+            OrderQueue, and_(OrderQueue.id == job_id, OrderQueue.created_by == current_user.id)
+        )
+
+    def get_job_by_key(self, idempotency_key: str, current_user) -> OrderQueue:
+        return self.repo.find_one(OrderQueue, and_(
+            OrderQueue.created_by == current_user.id,
+            OrderQueue.idempotency_key == idempotency_key
+        ))
+
+    def claim_jobs(self, batch_size: int = ORDER_QUEUE_BATCH_SIZE) -> List[OrderQueue]:
+        """
+        Claim up to `batch_size` queued jobs, oldest first, skipping jobs locked by other workers
+        """
+        rows = self.repo.execute("""
+            UPDATE order_queue SET
+                status = :processing,
+                attempts = attempts + 1,
+                updated_at = NOW()
+            WHERE id IN (
+                SELECT id FROM order_queue
+                WHERE status = :queued
+                   OR (status = :processing
+                       AND updated_at < NOW() - make_interval(secs => :visibility_timeout))
+                ORDER BY id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, {
+            'queued': OrderQueue.STATUS_QUEUED,
+            'processing': OrderQueue.STATUS_PROCESSING,
+            'visibility_timeout': ORDER_QUEUE_VISIBILITY_TIMEOUT,
+            'batch_size': batch_size
+        })
+        self.repo.commit()
+        if not rows:
+            return []
+        return self.repo.find(
+            OrderQueue, OrderQueue.id.in_([row['id'] for row in rows]), order_by=OrderQueue.id
+        )
+
+    def drain(self, batch_size: int = ORDER_QUEUE_BATCH_SIZE) -> int:
+        """
+        Claim and process one batch of jobs, returning the number of processed jobs
+        """
+        jobs = self.claim_jobs(batch_size)
+        for job in jobs:
+            self.process_job(job)
+        return len(jobs)
+
+    def process_job(self, job: OrderQueue):
+        if job.attempts > ORDER_QUEUE_MAX_ATTEMPTS:
+            self._mark_failed(job, f'Gave up after {ORDER_QUEUE_MAX_ATTEMPTS} attempts')
+            return
+
+        try:
+            with UnitOfWork():
+                user = self.user_service.get_cached_user(job.created_by)
+                order, _ = self.order_service.create_order_from_request(job.payload, user)
+                self._mark_success(job, order.id)
+            self.logger.info(f'Order queue job {job.id} created order {order.id}')
+        except ValueError as e:
+            self._mark_failed(job, str(e))
+        except (DataError, IntegrityError) as e:
+            self._mark_failed(job, str(e.orig).strip())
+        except Exception as e:
+            # Leave the job claimed; it is retried once the visibility timeout expires
+            self.logger.exception(f'Order queue job {job.id} failed: {e}')
+
+    def _add_job(self, data, current_user, idempotency_key, status) -> Tuple[OrderQueue, bool]:
+        if not idempotency_key:
+            raise ValueError('Idempotency key is required')
+
+        inserted = self.repo.insert_values(OrderQueue, [{
+            'idempotency_key': idempotency_key,
+            'created_by': current_user.id,
+            'payload': data,
+            'status': status
+        }], on_conflict=[OrderQueue.created_by, OrderQueue.idempotency_key], returning=[OrderQueue.id])
+
+        job_id = inserted[0].id if inserted else None
+        if job_id is None:
+            self.logger.info(f'Duplicate order submission {idempotency_key} of user {current_user.id}')
+            return self.get_job_by_key(idempotency_key, current_user), False
+        return self.repo.find_one(OrderQueue, OrderQueue.id == job_id), True
+
+    def _mark_success(self, job: OrderQueue, order_id: int):
+        job.status = OrderQueue.STATUS_SUCCESS
+        job.order_id = order_id
+        job.error = None
+        self.repo.upsert(job)
+
+    def _mark_failed(self, job: OrderQueue, error: str):
+        self.logger.error(f'Order queue job {job.id} failed: {error}')
+        job.status = OrderQueue.STATUS_FAILED
+        job.error = error
+        self.repo.upsert(job)
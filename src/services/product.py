@@ -1,58 +1,480 @@
 import csv
-from typing import List
+import hashlib
+import json
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+from threading import RLock
+from typing import Iterable, List, Optional
 
-from tqdm import tqdm
+from sqlalchemy import func, or_
 
+from src.default import (
+    ALLOW_NEGATIVE_STOCK, PRODUCT_CATALOG_REFRESH_INTERVAL, PRODUCT_CATALOG_TTL,
+    PRODUCT_SEARCH_DATABASE_FALLBACK
+)
+from src.helpers.collections_ import chunked
+from src.helpers.string import normalize_search_text, search_tokens
 from src.models import ImportLine
 from src.models.order_line import OrderLine
 from src.models.product import Product
+from src.repository import MissingKeysError
 from src.services import BaseService
 
 
+class ProductCatalog:
+    """Process-local copy of the product catalog, indexed by id and SKU.
+
+    Products are kept as JSON-ready dicts. `version` is bumped on every change and
+    `etag` is derived from the content, so it is comparable across uwsgi workers.
+    """
+    # Rows updated this long before the newest seen `updated_at` are fetched again, to
+    # catch transactions that committed after a later one
+    REFRESH_OVERLAP = timedelta(seconds=60)
+
+    def __init__(self):
+        self.version = 0
+        self.loaded_at = None
+        self.checked_at = None
+        self.watermark = None
+        self._by_id = {}
+        self._id_by_sku = {}
+        self._ids = []
+        self._etag = None
+        self._search_index = None
+        self._lock = RLock()
+
+    @property
+    def etag(self) -> str:
+        with self._lock:
+            if self._etag is None:
+                content = json.dumps(self.values(), sort_keys=True, default=str)
+                self._etag = hashlib.blake2b(content.encode(), digest_size=12).hexdigest()
+            return self._etag
+
+    def get(self, product_id: int) -> dict:
+        return self._by_id.get(product_id)
+
+    def get_by_sku(self, sku: str) -> dict:
+        product_id = self._id_by_sku.get(sku.strip().upper())
+        return self._by_id.get(product_id)
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > PRODUCT_CATALOG_TTL
+
+    def needs_refresh(self) -> bool:
+        return time.monotonic() - self.checked_at > PRODUCT_CATALOG_REFRESH_INTERVAL
+
+    def page(self, page_size: Optional[int], after=None):
+        """Return products ordered by id after the keyset `after`, like `find_page`"""
+        if after and (len(after) != 1 or not isinstance(after[0], int)):
+            raise ValueError('Invalid cursor')
+
+        with self._lock:
+            start = bisect_right(self._ids, after[0]) if after else 0
+            if page_size is None:
+                return [self._by_id[product_id] for product_id in self._ids[start:]], None
+
+            ids = self._ids[start:start + page_size + 1]
+            products = [self._by_id[product_id] for product_id in ids[:page_size]]
+            next_after = [ids[page_size - 1]] if len(ids) > page_size else None
+            return products, next_after
+
+    def replace(self, products: Iterable[dict]):
+        with self._lock:
+            self._by_id = {}
+            self._id_by_sku = {}
+            self.watermark = None
+            self.merge(products)
+            self._search_index = ProductSearchIndex(self._by_id.values())
+            self.loaded_at = time.monotonic()
+            self._bump()
+
+    def merge(self, products: Iterable[dict]) -> int:
+        """Insert or replace products, returning the number of changed products"""
+        with self._lock:
+            changed = 0
+            for product in products:
+                current = self._by_id.get(product['id'])
+                if current != product:
+                    self._by_id[product['id']] = product
+                    self._id_by_sku[product['sku']] = product['id']
+                    changed += 1
+                    # Stock and price changes keep the search index, only words matter to it
+                    if not current or (current['sku'], current['name']) != (product['sku'], product['name']):
+                        self._search_index = None
+                if self.watermark is None or product['updated_at'] > self.watermark:
+                    self.watermark = product['updated_at']
+            self.checked_at = time.monotonic()
+            if changed:
+                self._bump()
+            return changed
+
+    def search(self, query: str, limit: int) -> list:
+        """Find up to `limit` products by the words of their SKU and name, see `ProductSearchIndex`"""
+        with self._lock:
+            if self._search_index is None:
+                self._search_index = ProductSearchIndex(self._by_id.values())
+            return [self._by_id[product_id] for product_id in self._search_index.search(query, limit)]
+
+    def update_stock(self, stock_levels: dict):
+        """Apply new stock quantities of already committed stock adjustments"""
+        with self._lock:
+            changed = False
+            for product_id, stock_quantity in stock_levels.items():
+                product = self._by_id.get(product_id)
+                if product and product['stock_quantity'] != stock_quantity:
+                    self._by_id[product_id] = {**product, 'stock_quantity': stock_quantity}
+                    changed = True
+            if changed:
+                self._bump()
+
+    def values(self) -> list:
+        with self._lock:
+            return [self._by_id[product_id] for product_id in self._ids]
+
+    def _bump(self):
+        self._ids = sorted(self._by_id)
+        self._etag = None
+        self.version += 1
+
+
+class ProductSearchIndex:
+    """Prefix index over the words of product SKUs and names.
+
+    Every word, and the whole SKU, is normalized with `normalize_search_text` and kept
+    in one sorted list, so the products having a word starting with a term are a
+    contiguous slice found with two bisections. Whole SKUs and names are kept sorted
+    too, to rank the products starting with the query without scanning the matches.
+    """
+
+    def __init__(self, products: Iterable[dict]):
+        products = list(products)
+        entries = sorted({
+            (token, product['id'])
+            for product in products
+            for token in (
+                normalize_search_text(product['sku']),
+                *search_tokens(product['sku']),
+                *search_tokens(product['name'])
+            )
+        })
+        self._tokens = [token for token, _ in entries]
+        self._ids = [product_id for _, product_id in entries]
+        self._skus = sorted((normalize_search_text(product['sku']), product['id']) for product in products)
+        self._names = sorted((normalize_search_text(product['name']), product['id']) for product in products)
+        self._name_order = {product_id: position for position, (_, product_id) in enumerate(self._names)}
+
+    def search(self, query: str, limit: int) -> list:
+        """
+        Ids of up to `limit` products having a word starting with each word of `query`.
+        SKUs starting with the query rank first, the exact SKU ahead, then names
+        starting with the query, then the other matches by name.
+        """
+        matched = self._match(search_tokens(query))
+        if not matched:
+            return []
+
+        normalized = normalize_search_text(query.strip())
+        found = []
+        for sorted_values in (self._skus, self._names):
+            for index in range(bisect_left(sorted_values, (normalized,)), len(sorted_values)):
+                value, product_id = sorted_values[index]
+                if len(found) == limit or not value.startswith(normalized):
+                    break
+                if product_id in matched and product_id not in found:
+                    found.append(product_id)
+
+        if len(found) < limit:
+            remaining = matched.difference(found)
+            if len(remaining) * 8 > len(self._names):
+                # Dense matches: walk the names in order and stop early
+                others = (product_id for _, product_id in self._names if product_id in remaining)
+            else:
+                others = sorted(remaining, key=self._name_order.__getitem__)
+            found.extend(islice(others, limit - len(found)))
+        return found
+
+    def _match(self, terms: List[str]) -> set:
+        matched = None
+        for term in sorted(terms, key=len, reverse=True):
+            start = bisect_left(self._tokens, term)
+            end = bisect_left(self._tokens, term + '\U0010ffff', start)
+            ids = set(self._ids[start:end])
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                break
+        return matched or set()
+
+
+product_catalog = ProductCatalog()
+
+
 class ProductService(BaseService):
+    SEARCH_FIELDS = ('id', 'sku', 'name', 'unit_price', 'sale_price', 'stock_quantity', 'image_url')
+    STAGING_TABLE = 'product_staging'
+    STAGING_COLUMNS = ('line_no', 'sku', 'name', 'unit_price', 'sale_price', 'description', 'image_url')
+    STAGED_PRODUCTS = f"""
+        SELECT DISTINCT ON (sku) sku, name, unit_price, sale_price, description, image_url
+        FROM {STAGING_TABLE}
+        ORDER BY sku, line_no DESC
+    """
+
     def __init__(self):
         super().__init__()
 
-    def import_products_from_csv(self, file_path: str):
+    def import_products_from_csv(self, file_path: str, chunk_size: int = 5000,
+                                 dry_run: bool = False) -> dict:
+        """Stream a product CSV into the catalog, upserting by SKU one chunk at a time.
+
+        Each chunk is COPYed into a temporary staging table and merged with a single
+        INSERT ... ON CONFLICT (sku) DO UPDATE, then committed. When a SKU appears
+        more than once in a chunk, its last row wins.
+
+        :param file_path: The CSV file path
+        :param chunk_size: The number of rows per COPY and upsert
+        :param dry_run: Report what would change and roll every chunk back
+        :return: Counts of read, inserted, updated and unchanged products and throughput.
+        Dry runs also list the new and changed SKUs.
+        """
         if not file_path:
             raise ValueError('file_path is required')
 
-        self.logger.info(f'Importing products from {file_path}')
-        with open(file_path, encoding='utf-8') as file:
-            rows = list(csv.DictReader(file))
-            for row in tqdm(rows, desc='Importing products', total=len(rows)):
-                row['sku'] = row['sku'].strip().upper()
-                existed_product = self.repo.find_one(Product, Product.sku == row['sku'])
-                product = Product(**row)
-                if existed_product:
-                    product = self._update_product(existed_product, product)
-                self.repo.upsert(product)
-        self.logger.info('Import completed!')
+        self.logger.info(f'Importing products from {file_path} (chunk size {chunk_size})')
+        report = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0}
+        if dry_run:
+            report.update({'new_skus': [], 'changed_skus': []})
+
+        started_at = time.perf_counter()
+        with open(file_path, encoding='utf-8', newline='') as file:
+            for chunk in chunked(self._read_product_rows(file), chunk_size):
+                chunk_report = self._import_product_chunk(chunk, dry_run)
+                for key, value in chunk_report.items():
+                    report[key] += value
+                report['rows'] += len(chunk)
+
+                elapsed = time.perf_counter() - started_at
+                self.logger.info(
+                    f'{report["rows"]} rows processed ({report["rows"] / elapsed:.0f} rows/s)'
+                )
+
+        elapsed = time.perf_counter() - started_at
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['rows_per_second'] = round(report['rows'] / elapsed) if elapsed else 0
+        self.logger.info(f'Import {"dry run " if dry_run else ""}completed! {report}')
+        return report
 
     def get_products(self) -> List[Product]:
         return self.repo.get_all(Product)
 
-    def update_stock_quantity_from_import_lines(self, import_lines: List[ImportLine]):
+    def iter_products(self):
+        return self.repo.stream_projection(Product, order_by=Product.id)
+
+    def get_catalog(self) -> ProductCatalog:
+        """Return the product catalog cache, reloading or refreshing it when due.
+
+        A refresh only fetches products updated since the newest `updated_at` seen,
+        which picks up stock changes made by other processes without a full reload.
+        """
+        if product_catalog.is_stale():
+            self.logger.info('Loading product catalog')
+            product_catalog.replace(self.repo.find_projection(Product, order_by=Product.id))
+        elif product_catalog.needs_refresh() and product_catalog.watermark is None:
+            # Nothing to refresh from while the catalog is empty
+            product_catalog.replace(self.repo.find_projection(Product, order_by=Product.id))
+        elif product_catalog.needs_refresh():
+            updated = self.repo.find_projection(
+                Product, Product.updated_at >= product_catalog.watermark - ProductCatalog.REFRESH_OVERLAP
+            )
+            if changed := product_catalog.merge(updated):
+                self.logger.info(f'Refreshed {changed} products of the catalog')
+        return product_catalog
+
+    def search_products(self, query: str, limit: int) -> List[dict]:
+        """Find products for autocompletion by the words of their SKU and name.
+
+        Matches come from the prefix index of the in-process catalog, ignoring case and
+        diacritics. When it finds fewer than `limit`, the remaining ones are looked up in
+        the database, by substring and trigram similarity.
+
+        :return: Up to `limit` products with their price and stock, best matches first
+        """
+        products = self.get_catalog().search(query, limit)
+        query = query.strip()
+        if len(products) < limit and len(query) >= 3 and PRODUCT_SEARCH_DATABASE_FALLBACK:
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            criterion = [or_(
+                Product.sku.ilike(pattern), Product.name.ilike(pattern), Product.name.op('%')(query)
+            )]
+            if products:
+                criterion.append(Product.id.notin_([product['id'] for product in products]))
+            products += self.repo.find_projection(
+                Product, *criterion, fields=self.SEARCH_FIELDS,
+                order_by=[func.similarity(Product.name, query).desc(), Product.id],
+                limit=limit - len(products)
+            )
+        return [{field: product[field] for field in self.SEARCH_FIELDS} for product in products]
+
+    def adjust_stock_quantities(self, deltas: dict, allow_negative: bool = True) -> dict:
+        """Apply stock deltas of many products in one statement.
+
+        :param deltas: Mapping of product id to the quantity to add (negative to remove)
+        :param allow_negative: Reject the whole batch if any stock would drop below zero
+        :return: Mapping of product id to its resulting stock quantity
+        """
+        self.logger.info(f'Adjusting stock quantity of {len(deltas)} products')
+        try:
+            stock_levels = self.repo.bulk_increment(
+                Product, Product.id, Product.stock_quantity, deltas,
+                min_value=None if allow_negative else 0
+            )
+            self.repo.after_commit(lambda: product_catalog.update_stock(stock_levels))
+            return stock_levels
+        except MissingKeysError as e:
+            self.logger.error(e)
+            raise ValueError(f'Products {e.keys} do not exist.') from e
+        except ValueError as e:
+            self.logger.error(e)
+            raise ValueError('Not enough stock to fulfill the order.') from e
+
+    def update_average_costs(self, import_lines: List[ImportLine]):
+        """Blend imported units into the weighted-average cost of their products.
+
+        Call it before the stock of the lines is added: the new average is
+        `(stock * average_cost + quantity * unit_price) / (stock + quantity)`, and the
+        cost of a product without stock on hand becomes its import price.
+        """
+        quantities, costs = Counter(), Counter()
+        for line in import_lines:
+            quantities[line.product_id] += line.quantity
+            costs[line.product_id] += line.quantity * line.unit_price
+        product_ids = [product_id for product_id, quantity in quantities.items() if quantity > 0]
+        if not product_ids:
+            return
+
+        self.logger.info(f'Updating average cost of {len(product_ids)} products')
+        self.repo.execute("""
+            UPDATE product p SET
+                average_cost = CASE
+                    WHEN p.stock_quantity > 0 AND p.average_cost IS NOT NULL
+                    THEN (p.stock_quantity * p.average_cost + l.cost) / (p.stock_quantity + l.quantity)
+                    ELSE l.cost / l.quantity
+                END,
+                updated_at = NOW()
+            FROM unnest(CAST(:product_ids AS INTEGER[]), CAST(:quantities AS INTEGER[]),
+                        CAST(:costs AS NUMERIC[])) AS l (product_id, quantity, cost)
+            WHERE p.id = l.product_id
+        """, {
+            'product_ids': product_ids,
+            'quantities': [quantities[product_id] for product_id in product_ids],
+            'costs': [costs[product_id] for product_id in product_ids]
+        })
+
+    def get_stock_and_costs(self, product_ids: Iterable[int], for_update: bool = False) -> dict:
+        """
+        Get the stock quantity and current unit cost of products. The unit cost is the
+        average cost, or the unit price until the product is first imported.
+
+        :param for_update: Lock the products until the end of the transaction
+        :return: Mapping of product id to a row of `stock_quantity` and `unit_cost`,
+        unknown products are left out
+        """
+        lock = 'FOR UPDATE' if for_update else ''
+        rows = self.repo.execute(f"""
+            SELECT id, COALESCE(average_cost, unit_price) AS unit_cost, stock_quantity
+            FROM product WHERE id = ANY(:ids) ORDER BY id {lock}
+        """, {'ids': list(product_ids)})
+        return {row['id']: row for row in rows}
+
+    def update_stock_quantity_from_import_lines(self, import_lines: List[ImportLine]) -> dict:
         self.logger.info(f'Updating stock quantity from {len(import_lines)} import lines')
-        for import_line in import_lines:
-            product = self.repo.find_one(Product, Product.id == import_line.product_id)
-            product.stock_quantity += import_line.quantity
-            self.repo.upsert(product)
-        self.logger.info('Stock quantity updated!')
+        return self.adjust_stock_quantities(self._sum_quantities(import_lines))
 
-    def update_stock_quantity_from_order_lines(self, order_lines: List[OrderLine]):
+    def update_stock_quantity_from_order_lines(self, order_lines: List[OrderLine]) -> dict:
         self.logger.info(f'Updating stock quantity from {len(order_lines)} order lines')
-        for order_line in order_lines:
-            product = self.repo.find_one(Product, Product.id == order_line.product_id)
-            product.stock_quantity -= order_line.quantity
-            self.repo.upsert(product)
-        self.logger.info('Stock quantity updated!')
+        deltas = {
+            product_id: -quantity
+            for product_id, quantity in self._sum_quantities(order_lines).items()
+        }
+        return self.adjust_stock_quantities(deltas, allow_negative=ALLOW_NEGATIVE_STOCK)
+
+    @staticmethod
+    def _sum_quantities(lines: Iterable) -> Counter:
+        quantities = Counter()
+        for line in lines:
+            quantities[line.product_id] += line.quantity
+        return quantities
+
+    def _import_product_chunk(self, rows: list, dry_run: bool) -> dict:
+        try:
+            self.repo.execute(f"""
+                CREATE TEMP TABLE {self.STAGING_TABLE} (
+                    line_no       INTEGER         NOT NULL,
+                    sku           VARCHAR(255)    NOT NULL,
+                    name          VARCHAR(255)    NOT NULL,
+                    unit_price    DECIMAL(10, 2)  NOT NULL,
+                    sale_price    DECIMAL(10, 2)  NOT NULL,
+                    description   TEXT,
+                    image_url     TEXT            NOT NULL
+                ) ON COMMIT DROP
+            """)
+            self.repo.copy_rows(self.STAGING_TABLE, self.STAGING_COLUMNS, rows)
+            chunk_report = self._diff_staged_products(with_skus=dry_run)
+            if dry_run:
+                self.repo.rollback()
+                return chunk_report
+
+            self.repo.execute(f"""
+                INSERT INTO public.product AS p (sku, name, unit_price, sale_price, description, image_url)
+                {self.STAGED_PRODUCTS}
+                ON CONFLICT (sku) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    unit_price = EXCLUDED.unit_price,
+                    sale_price = EXCLUDED.sale_price,
+                    description = EXCLUDED.description,
+                    image_url = EXCLUDED.image_url,
+                    updated_at = NOW()
+                WHERE (p.name, p.unit_price, p.sale_price, p.description, p.image_url)
+                    IS DISTINCT FROM
+                    (EXCLUDED.name, EXCLUDED.unit_price, EXCLUDED.sale_price,
+                     EXCLUDED.description, EXCLUDED.image_url)
+            """)
+            self.repo.commit()
+            return chunk_report
+        except Exception as e:
+            self.repo.rollback()
+            raise e
+
+    def _diff_staged_products(self, with_skus: bool) -> dict:
+        """Compare the staged chunk against the catalog"""
+        skus_columns = """,
+            COALESCE(ARRAY_AGG(s.sku) FILTER (WHERE p.id IS NULL), '{}') AS new_skus,
+            COALESCE(ARRAY_AGG(s.sku) FILTER (WHERE changed), '{}') AS changed_skus
+        """ if with_skus else ''
+        result = self.repo.execute(f"""
+            WITH staged AS ({self.STAGED_PRODUCTS})
+            SELECT
+                COUNT(*) FILTER (WHERE p.id IS NULL) AS inserted,
+                COUNT(*) FILTER (WHERE changed) AS updated,
+                COUNT(*) FILTER (WHERE p.id IS NOT NULL AND NOT changed) AS unchanged
+                {skus_columns}
+            FROM staged s
+            LEFT JOIN public.product p ON p.sku = s.sku
+            CROSS JOIN LATERAL (
+                SELECT p.id IS NOT NULL AND
+                    (p.name, p.unit_price, p.sale_price, p.description, p.image_url)
+                    IS DISTINCT FROM
+                    (s.name, s.unit_price, s.sale_price, s.description, s.image_url) AS changed
+            ) c
+        """)
+        return dict(result[0])
 
     @staticmethod
-    def _update_product(existed_product: Product, new_product: Product) -> Product:
-        existed_product.name = new_product.name
-        existed_product.unit_price = new_product.unit_price
-        existed_product.sale_price = new_product.sale_price
-        existed_product.description = new_product.description
-        existed_product.image_url = new_product.image_url
-        return existed_product
+    def _read_product_rows(file) -> Iterable[tuple]:
+        for line_no, row in enumerate(csv.DictReader(file), start=1):
+            yield (
+                line_no, row['sku'].strip().upper(), row['name'], row['unit_price'],
+                row['sale_price'], row.get('description'), row['image_url']
+            )
@@ -0,0 +1,498 @@
+from datetime import date
+from typing import List
+
+from src.default import DASHBOARD_SKETCH_CAPACITY
+from src.repository import UnitOfWork
+from src.services import BaseService
+
+
+class RollupService(BaseService):
+    """Maintains and reads the daily sales, customer and import rollups used by the dashboard."""
+
+    SALES_ROLLUP_SELECT = """
+        SELECT
+            o.order_at,
+            ol.product_id,
+            SUM(ol.quantity),
+            SUM(ol.quantity * ol.sale_price),
+            SUM(ol.discount),
+            SUM(ol.quantity * ol.unit_cost)
+        FROM order_line ol
+        JOIN "order" o ON ol.order_id = o.id
+        WHERE {condition}
+        GROUP BY o.order_at, ol.product_id
+    """
+    CUSTOMER_ROLLUP_SELECT = """
+        SELECT
+            o.order_at,
+            o.customer_id,
+            COUNT(DISTINCT o.id),
+            SUM(ol.quantity),
+            SUM(ol.quantity * ol.sale_price),
+            SUM(ol.discount),
+            SUM(ol.quantity * ol.unit_cost)
+        FROM order_line ol
+        JOIN "order" o ON ol.order_id = o.id
+        WHERE {condition}
+        GROUP BY o.order_at, o.customer_id
+    """
+    IMPORT_ROLLUP_SELECT = """
+        SELECT
+            i.imported_at,
+            il.product_id,
+            SUM(il.quantity),
+            SUM(il.quantity * il.unit_price)
+        FROM import_line il
+        JOIN importer i ON il.importer_id = i.id
+        WHERE {condition}
+        GROUP BY i.imported_at, il.product_id
+    """
+
+    BUMP_VERSIONS = """
+        INSERT INTO rollup_version AS v (day)
+        {select_days}
+        ORDER BY 1
+        ON CONFLICT (day) DO UPDATE SET
+            version = v.version + 1,
+            updated_at = NOW()
+    """
+
+    # Rollup table and item column of each dimension served by `get_top`
+    TOP_DIMENSIONS = {
+        'products': ('sales_daily_rollup', 'product_id'),
+        'customers': ('customer_daily_rollup', 'customer_id')
+    }
+    TOP_METRICS = ('quantity', 'revenue', 'profit')
+    # Metrics kept in `top_daily_sketch`, which needs non-negative daily values
+    SKETCH_METRICS = ('quantity', 'revenue')
+
+    def __init__(self):
+        super().__init__()
+
+    def apply_orders(self, order_ids: List[int]):
+        """
+        Add the lines of newly committed orders to the sales and customer rollups, dropping
+        the top sketches of their days until `build_sketches` runs again
+        """
+        if not order_ids:
+            return
+
+        self.logger.info(f'Applying {len(order_ids)} orders to the sales rollup')
+        select_lines = self.SALES_ROLLUP_SELECT.format(condition='ol.order_id = ANY(:order_ids)')
+        customer_lines = self.CUSTOMER_ROLLUP_SELECT.format(condition='ol.order_id = ANY(:order_ids)')
+        with UnitOfWork():
+            self.repo.execute(f"""
+                INSERT INTO sales_daily_rollup AS r (day, product_id, quantity, revenue, discount, cost)
+                {select_lines}
+                ON CONFLICT (day, product_id) DO UPDATE SET
+                    quantity = r.quantity + EXCLUDED.quantity,
+                    revenue = r.revenue + EXCLUDED.revenue,
+                    discount = r.discount + EXCLUDED.discount,
+                    cost = r.cost + EXCLUDED.cost,
+                    updated_at = NOW()
+            """, {'order_ids': list(order_ids)})
+            self.repo.execute(f"""
+                INSERT INTO customer_daily_rollup AS r
+                    (day, customer_id, orders, quantity, revenue, discount, cost)
+                {customer_lines}
+                ON CONFLICT (day, customer_id) DO UPDATE SET
+                    orders = r.orders + EXCLUDED.orders,
+                    quantity = r.quantity + EXCLUDED.quantity,
+                    revenue = r.revenue + EXCLUDED.revenue,
+                    discount = r.discount + EXCLUDED.discount,
+                    cost = r.cost + EXCLUDED.cost,
+                    updated_at = NOW()
+            """, {'order_ids': list(order_ids)})
+            self.repo.execute("""
+                DELETE FROM top_daily_sketch
+                WHERE day IN (SELECT order_at FROM "order" WHERE id = ANY(:order_ids))
+            """, {'order_ids': list(order_ids)})
+            self.repo.execute(self.BUMP_VERSIONS.format(
+                select_days='SELECT DISTINCT order_at FROM "order" WHERE id = ANY(:order_ids)'
+            ), {'order_ids': list(order_ids)})
+
+    def apply_importers(self, importer_ids: List[int]):
+        """
+        Add the lines of newly committed importers to the import rollup
+        """
+        if not importer_ids:
+            return
+
+        self.logger.info(f'Applying {len(importer_ids)} importers to the import rollup')
+        select_lines = self.IMPORT_ROLLUP_SELECT.format(
+            condition='il.importer_id = ANY(:importer_ids)'
+        )
+        with UnitOfWork():
+            self.repo.execute(f"""
+                INSERT INTO import_daily_rollup AS r (day, product_id, quantity, cost)
+                {select_lines}
+                ON CONFLICT (day, product_id) DO UPDATE SET
+                    quantity = r.quantity + EXCLUDED.quantity,
+                    cost = r.cost + EXCLUDED.cost,
+                    updated_at = NOW()
+            """, {'importer_ids': list(importer_ids)})
+            self.repo.execute(self.BUMP_VERSIONS.format(
+                select_days='SELECT DISTINCT imported_at FROM importer WHERE id = ANY(:importer_ids)'
+            ), {'importer_ids': list(importer_ids)})
+
+    def rebuild(self, start_date: date = None, end_date: date = None) -> dict:
+        """
+        Recompute the rollups from order and import lines, for the whole history or
+        only the days between `start_date` and `end_date`
+        """
+        start_date = start_date or date.min
+        end_date = end_date or date.max
+        self.logger.info(f'Rebuilding rollups from {start_date} to {end_date}')
+        params = {'start_date': start_date, 'end_date': end_date}
+        sales_lines = self.SALES_ROLLUP_SELECT.format(
+            condition='o.order_at BETWEEN :start_date AND :end_date'
+        )
+        customer_lines = self.CUSTOMER_ROLLUP_SELECT.format(
+            condition='o.order_at BETWEEN :start_date AND :end_date'
+        )
+        import_lines = self.IMPORT_ROLLUP_SELECT.format(
+            condition='i.imported_at BETWEEN :start_date AND :end_date'
+        )
+
+        with UnitOfWork():
+            # Days that have or will have rollup rows
+            self.repo.execute(self.BUMP_VERSIONS.format(select_days="""
+                SELECT order_at FROM "order" WHERE order_at BETWEEN :start_date AND :end_date
+                UNION SELECT imported_at FROM importer WHERE imported_at BETWEEN :start_date AND :end_date
+                UNION SELECT day FROM sales_daily_rollup WHERE day BETWEEN :start_date AND :end_date
+                UNION SELECT day FROM import_daily_rollup WHERE day BETWEEN :start_date AND :end_date
+            """), params)
+            self.repo.execute(
+                'DELETE FROM sales_daily_rollup WHERE day BETWEEN :start_date AND :end_date', params
+            )
+            self.repo.execute(
+                'DELETE FROM customer_daily_rollup WHERE day BETWEEN :start_date AND :end_date', params
+            )
+            self.repo.execute(
+                'DELETE FROM import_daily_rollup WHERE day BETWEEN :start_date AND :end_date', params
+            )
+            sales = self.repo.execute(f"""
+                WITH inserted AS (
+                    INSERT INTO sales_daily_rollup (day, product_id, quantity, revenue, discount, cost)
+                    {sales_lines}
+                    RETURNING 1
+                )
+                SELECT COUNT(*) AS count FROM inserted
+            """, params)
+            customers = self.repo.execute(f"""
+                WITH inserted AS (
+                    INSERT INTO customer_daily_rollup
+                        (day, customer_id, orders, quantity, revenue, discount, cost)
+                    {customer_lines}
+                    RETURNING 1
+                )
+                SELECT COUNT(*) AS count FROM inserted
+            """, params)
+            imports = self.repo.execute(f"""
+                WITH inserted AS (
+                    INSERT INTO import_daily_rollup (day, product_id, quantity, cost)
+                    {import_lines}
+                    RETURNING 1
+                )
+                SELECT COUNT(*) AS count FROM inserted
+            """, params)
+
+            self.repo.execute(
+                'DELETE FROM top_daily_sketch WHERE day BETWEEN :start_date AND :end_date', params
+            )
+            sketched_days = self.build_sketches(start_date, end_date)['days']
+
+        report = {
+            'sales_rows': sales[0]['count'],
+            'customer_rows': customers[0]['count'],
+            'import_rows': imports[0]['count'],
+            'sketched_days': sketched_days
+        }
+        self.logger.info(f'Rollups rebuilt: {report}')
+        return report
+
+    def build_sketches(self, start_date: date = None, end_date: date = None) -> dict:
+        """
+        Store the top sketch of every day with sales but no sketch yet, for the whole
+        history or only the days between `start_date` and `end_date`.
+
+        The sketch of a day keeps its `DASHBOARD_SKETCH_CAPACITY` heaviest products and
+        customers for each of `SKETCH_METRICS`, with the value of the first item left out
+        as the `floor` of any other one. New orders drop the sketch of their day.
+        """
+        params = {'start_date': start_date or date.min, 'end_date': end_date or date.max}
+        with UnitOfWork():
+            # Wait for in-flight orders, which might not drop a sketch built without them
+            self.repo.execute('LOCK TABLE sales_daily_rollup, customer_daily_rollup IN SHARE MODE')
+            days = [row['day'] for row in self.repo.execute("""
+                SELECT DISTINCT r.day
+                FROM sales_daily_rollup r
+                WHERE r.day BETWEEN :start_date AND :end_date
+                    AND NOT EXISTS (SELECT 1 FROM top_daily_sketch s WHERE s.day = r.day)
+            """, params)]
+            if days:
+                for dimension, (table, item_column) in self.TOP_DIMENSIONS.items():
+                    for metric in self.SKETCH_METRICS:
+                        self.repo.execute(f"""
+                            INSERT INTO top_daily_sketch (dimension, metric, day, item_id, value, floor)
+                            SELECT :dimension, :metric, day, item_id, value, floor
+                            FROM (
+                                SELECT
+                                    day, item_id, value, rank,
+                                    COALESCE(MAX(value) FILTER (WHERE rank = :capacity + 1)
+                                        OVER (PARTITION BY day), 0) AS floor
+                                FROM (
+                                    SELECT
+                                        day, {item_column} AS item_id, {metric} AS value,
+                                        ROW_NUMBER() OVER (
+                                            PARTITION BY day ORDER BY {metric} DESC, {item_column}
+                                        ) AS rank
+                                    FROM {table}
+                                    WHERE day = ANY(:days)
+                                ) ranked
+                            ) s
+                            WHERE rank <= :capacity
+                        """, {
+                            'dimension': dimension, 'metric': metric, 'days': days,
+                            'capacity': DASHBOARD_SKETCH_CAPACITY
+                        })
+
+        report = {'days': len(days)}
+        self.logger.info(f'Top sketches built: {report}')
+        return report
+
+    def get_version(self, start_date, end_date) -> int:
+        """
+        Get the version of the rollups of a date range, which grows whenever the rollups
+        of one of its days change in any process
+        """
+        return self.repo.execute("""
+            SELECT COALESCE(SUM(version), 0) AS version
+            FROM rollup_version
+            WHERE day >= :start_date AND day <= :end_date
+        """, {'start_date': start_date, 'end_date': end_date})[0]['version']
+
+    def get_sales_metrics(self, start_date, end_date):
+        """
+        Get sales metrics for a given date range from the daily sales rollup
+        """
+        params = {'start_date': start_date, 'end_date': end_date}
+        results = self.repo.execute("""
+            SELECT
+                day AS order_at,
+                SUM(quantity) AS total_quantity,
+                SUM(revenue) AS total_revenue,
+                SUM(profit) AS total_profit
+            FROM sales_daily_rollup
+            WHERE day >= :start_date AND day <= :end_date
+            GROUP BY day
+            ORDER BY day
+        """, params)
+        transformed_results = {
+            'total_quantity': 0,
+            'total_revenue': 0,
+            'total_profit': 0,
+            'order_at_list': [],
+            'product_list': []
+        }
+        for result in results:
+            result = dict(result)
+            result['order_at'] = result['order_at'].strftime('%Y-%m-%d')
+            result['total_revenue'] = float(result['total_revenue'])
+            result['total_profit'] = float(result['total_profit'])
+            transformed_results['total_quantity'] += result['total_quantity']
+            transformed_results['total_revenue'] += result['total_revenue']
+            transformed_results['total_profit'] += result['total_profit']
+            transformed_results['order_at_list'].append(result)
+
+        products = self.repo.execute("""
+            SELECT
+                product_id,
+                SUM(quantity) AS total_quantity,
+                SUM(revenue) AS total_revenue,
+                SUM(discount) AS total_discount,
+                SUM(cost) AS total_cost,
+                SUM(profit) AS total_profit
+            FROM sales_daily_rollup
+            WHERE day >= :start_date AND day <= :end_date
+            GROUP BY product_id
+            ORDER BY product_id
+        """, params)
+        for product in products:
+            product = dict(product)
+            for key in ('total_revenue', 'total_discount', 'total_cost', 'total_profit'):
+                product[key] = float(product[key])
+            transformed_results['product_list'].append(product)
+        return transformed_results
+
+    def get_import_metrics(self, start_date, end_date):
+        """
+        Get import metrics for a given date range from the daily import rollup
+        """
+        params = {'start_date': start_date, 'end_date': end_date}
+        results = self.repo.execute("""
+            SELECT
+                day AS imported_at,
+                SUM(quantity) AS total_quantity,
+                SUM(cost) AS total_cost
+            FROM import_daily_rollup
+            WHERE day >= :start_date AND day <= :end_date
+            GROUP BY day
+            ORDER BY day
+        """, params)
+        transformed_results = {
+            'total_quantity': 0,
+            'total_cost': 0,
+            'import_at_list': [],
+            'product_list': []
+        }
+        for result in results:
+            result = dict(result)
+            result['imported_at'] = result['imported_at'].strftime('%Y-%m-%d')
+            result['total_cost'] = float(result['total_cost'])
+            transformed_results['total_quantity'] += result['total_quantity']
+            transformed_results['total_cost'] += result['total_cost']
+            transformed_results['import_at_list'].append(result)
+
+        products = self.repo.execute("""
+            SELECT product_id, SUM(quantity) AS total_quantity, SUM(cost) AS total_cost
+            FROM import_daily_rollup
+            WHERE day >= :start_date AND day <= :end_date
+            GROUP BY product_id
+            ORDER BY product_id
+        """, params)
+        for product in products:
+            product = dict(product)
+            product['total_cost'] = float(product['total_cost'])
+            transformed_results['product_list'].append(product)
+        return transformed_results
+
+    def get_top(self, dimension: str, metric: str, start_date, end_date, limit: int) -> list:
+        """
+        Get the `limit` products or customers with the highest total `metric` over the range,
+        summing their daily rollup rows
+
+        :param dimension: `products` or `customers`
+        :param metric: `quantity`, `revenue` or `profit`
+        """
+        table, item_column = self._get_top_source(dimension, metric)
+        if dimension == 'products':
+            details = 'p.sku, p.name FROM totals t LEFT JOIN product p ON p.id = t.product_id'
+        else:
+            details = 'c.name, t.orders FROM totals t LEFT JOIN customer c ON c.id = t.customer_id'
+        orders = ', SUM(orders) AS orders' if dimension == 'customers' else ''
+        rows = self.repo.execute(f"""
+            WITH totals AS (
+                SELECT
+                    {item_column},
+                    SUM(quantity) AS quantity,
+                    SUM(revenue) AS revenue,
+                    SUM(profit) AS profit
+                    {orders}
+                FROM {table}
+                WHERE day >= :start_date AND day <= :end_date
+                GROUP BY {item_column}
+                ORDER BY {metric} DESC, {item_column}
+                LIMIT :limit
+            )
+            SELECT t.{item_column}, t.quantity, t.revenue, t.profit, {details}
+            ORDER BY t.{metric} DESC, t.{item_column}
+        """, {'start_date': start_date, 'end_date': end_date, 'limit': limit})
+        return [self._to_top_item(row) for row in rows]
+
+    def get_approximate_top(self, dimension: str, metric: str, start_date, end_date, limit: int) -> list:
+        """
+        Rank products or customers from the top sketches of the range, and the daily rollup
+        rows of its days without a sketch, so long ranges read a bounded number of rows per day.
+
+        The value of each item is the total it is guaranteed to reach. Its true total is at
+        most `error` more, the floors of the sketched days it is missing from.
+
+        :param dimension: `products` or `customers`
+        :param metric: `quantity` or `revenue`
+        """
+        table, item_column = self._get_top_source(dimension, metric)
+        if metric not in self.SKETCH_METRICS:
+            raise ValueError(f'Approximate top is only available for {" and ".join(self.SKETCH_METRICS)}')
+        if dimension == 'products':
+            details = 'p.sku, p.name FROM totals t LEFT JOIN product p ON p.id = t.item_id'
+        else:
+            details = 'c.name FROM totals t LEFT JOIN customer c ON c.id = t.item_id'
+        rows = self.repo.execute(f"""
+            WITH sketch AS (
+                SELECT day, item_id, value, floor
+                FROM top_daily_sketch
+                WHERE dimension = :dimension AND metric = :metric
+                    AND day >= :start_date AND day <= :end_date
+            ), sketched_days AS (
+                SELECT day, MAX(floor) AS floor FROM sketch GROUP BY day
+            ), other_days AS (
+                SELECT CAST(d AS DATE) AS day
+                FROM generate_series(CAST(:start_date AS DATE), CAST(:end_date AS DATE), INTERVAL '1 day') d
+                EXCEPT
+                SELECT day FROM sketched_days
+            ), totals AS (
+                SELECT item_id, SUM(value) AS value, SUM(floor) AS floor
+                FROM (
+                    SELECT item_id, value, floor FROM sketch
+                    UNION ALL
+                    SELECT {item_column}, {metric}, 0 FROM {table}
+                    WHERE day = ANY(ARRAY(SELECT day FROM other_days))
+                ) v
+                GROUP BY item_id
+                ORDER BY value DESC, item_id
+                LIMIT :limit
+            )
+            SELECT
+                t.item_id AS {item_column},
+                t.value AS {metric},
+                (SELECT COALESCE(SUM(floor), 0) FROM sketched_days) - t.floor AS error,
+                {details}
+            ORDER BY t.value DESC, t.item_id
+        """, {
+            'dimension': dimension, 'metric': metric, 'start_date': start_date, 'end_date': end_date,
+            'limit': limit
+        })
+        convert = float if metric == 'revenue' else int
+        return [{**row, metric: convert(row[metric]), 'error': convert(row['error'])} for row in rows]
+
+    def get_slow_movers(self, start_date, end_date, limit: int) -> list:
+        """
+        Get the `limit` products in stock that sold the fewest units over the range,
+        the largest stock first among equals
+        """
+        rows = self.repo.execute("""
+            SELECT
+                p.id AS product_id,
+                p.sku,
+                p.name,
+                p.stock_quantity,
+                COALESCE(t.quantity, 0) AS quantity,
+                COALESCE(t.revenue, 0) AS revenue,
+                COALESCE(t.profit, 0) AS profit
+            FROM product p
+            LEFT JOIN (
+                SELECT product_id, SUM(quantity) AS quantity, SUM(revenue) AS revenue, SUM(profit) AS profit
+                FROM sales_daily_rollup
+                WHERE day >= :start_date AND day <= :end_date
+                GROUP BY product_id
+            ) t ON t.product_id = p.id
+            WHERE p.stock_quantity > 0
+            ORDER BY COALESCE(t.quantity, 0), p.stock_quantity DESC, p.id
+            LIMIT :limit
+        """, {'start_date': start_date, 'end_date': end_date, 'limit': limit})
+        return [self._to_top_item(row) for row in rows]
+
+    def _get_top_source(self, dimension: str, metric: str) -> tuple:
+        if dimension not in self.TOP_DIMENSIONS:
+            raise ValueError(f'dimension must be one of {", ".join(self.TOP_DIMENSIONS)}')
+        if metric not in self.TOP_METRICS:
+            raise ValueError(f'metric must be one of {", ".join(self.TOP_METRICS)}')
+        return self.TOP_DIMENSIONS[dimension]
+
+    @staticmethod
+    def _to_top_item(row) -> dict:
+        item = dict(row)
+        item['revenue'] = float(item['revenue'])
+        item['profit'] = float(item['profit'])
+        return item
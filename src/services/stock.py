@@ -0,0 +1,199 @@
+from datetime import date, timedelta
+from typing import Iterable, List
+
+from src.models.stock_movement import StockMovement
+from src.repository import UnitOfWork
+from src.services import BaseService
+
+
+class StockService(BaseService):
+    """Maintains the stock movement ledger and its daily snapshots.
+
+    Every change of `product.stock_quantity` is also appended to `stock_movement`,
+    dated by the business date of its import or order. A snapshot holds the stock of
+    each product at the end of a day, so the stock at any date is the latest snapshot
+    before it plus the movements in between. Movements dated on or before an existing
+    snapshot are added to it in the same statement, keeping snapshots exact.
+    """
+
+    RECORD_MOVEMENTS = """
+        WITH inserted AS (
+            INSERT INTO stock_movement (product_id, quantity, moved_at, source_type, source_id)
+            {select_movements}
+            RETURNING product_id, quantity, moved_at
+        )
+        INSERT INTO stock_snapshot AS s (day, product_id, quantity)
+        SELECT d.day, i.product_id, SUM(i.quantity)
+        FROM inserted i
+        JOIN (
+            SELECT DISTINCT day FROM stock_snapshot
+            WHERE day >= (SELECT MIN(moved_at) FROM inserted)
+        ) d ON d.day >= i.moved_at
+        GROUP BY d.day, i.product_id
+        ON CONFLICT (day, product_id) DO UPDATE SET
+            quantity = s.quantity + EXCLUDED.quantity,
+            updated_at = NOW()
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    def record_orders(self, order_ids: List[int]):
+        """
+        Append the lines of newly created orders to the ledger
+        """
+        if not order_ids:
+            return
+
+        self.logger.info(f'Recording stock movements of {len(order_ids)} orders')
+        self.repo.execute(self.RECORD_MOVEMENTS.format(select_movements="""
+            SELECT ol.product_id, -ol.quantity, o.order_at, :source_type, o.id
+            FROM order_line ol
+            JOIN "order" o ON o.id = ol.order_id
+            WHERE ol.order_id = ANY(:order_ids)
+        """), {'order_ids': list(order_ids), 'source_type': StockMovement.SOURCE_ORDER})
+
+    def record_importers(self, importer_ids: List[int]):
+        """
+        Append the lines of newly created importers to the ledger
+        """
+        if not importer_ids:
+            return
+
+        self.logger.info(f'Recording stock movements of {len(importer_ids)} importers')
+        self.repo.execute(self.RECORD_MOVEMENTS.format(select_movements="""
+            SELECT il.product_id, il.quantity, i.imported_at, :source_type, i.id
+            FROM import_line il
+            JOIN importer i ON i.id = il.importer_id
+            WHERE il.importer_id = ANY(:importer_ids)
+        """), {'importer_ids': list(importer_ids), 'source_type': StockMovement.SOURCE_IMPORT})
+
+    def record_adjustments(self, deltas: dict, moved_at: date = None):
+        """
+        Append stock corrections that are not explained by an import or an order
+
+        :param deltas: Mapping of product id to the quantity added (negative when removed)
+        :param moved_at: Business date of the corrections, today if not specified
+        """
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        self.logger.info(f'Recording stock adjustments of {len(deltas)} products')
+        self.repo.execute(self.RECORD_MOVEMENTS.format(select_movements="""
+            SELECT product_id, quantity, :moved_at, :source_type, NULL
+            FROM unnest(CAST(:product_ids AS INTEGER[]), CAST(:quantities AS INTEGER[]))
+                AS d (product_id, quantity)
+        """), {
+            'product_ids': list(deltas),
+            'quantities': list(deltas.values()),
+            'moved_at': moved_at or date.today(),
+            'source_type': StockMovement.SOURCE_ADJUSTMENT
+        })
+
+    def take_snapshot(self, day: date = None) -> dict:
+        """
+        Store the stock of every product at the end of `day` (yesterday if not specified),
+        adding the movements since the previous snapshot to it. Taking the snapshot of a
+        day again recomputes it.
+        """
+        day = day or date.today() - timedelta(days=1)
+        with UnitOfWork():
+            # Wait for in-flight movements, which might not see the new snapshot yet
+            self.repo.execute('LOCK TABLE stock_movement IN SHARE MODE')
+            previous_day = self.repo.execute(
+                'SELECT MAX(day) AS day FROM stock_snapshot WHERE day < :day', {'day': day}
+            )[0]['day']
+            result = self.repo.execute("""
+                WITH inserted AS (
+                    INSERT INTO stock_snapshot AS s (day, product_id, quantity)
+                    SELECT :day, product_id, SUM(quantity)
+                    FROM (
+                        SELECT product_id, quantity FROM stock_snapshot WHERE day = :previous_day
+                        UNION ALL
+                        SELECT product_id, quantity FROM stock_movement
+                        WHERE moved_at > :previous_day AND moved_at <= :day
+                    ) m
+                    GROUP BY product_id
+                    ON CONFLICT (day, product_id) DO UPDATE SET
+                        quantity = EXCLUDED.quantity,
+                        updated_at = NOW()
+                    RETURNING 1
+                )
+                SELECT COUNT(*) AS count FROM inserted
+            """, {'day': day, 'previous_day': previous_day or date.min})
+
+        report = {
+            'day': day.isoformat(),
+            'previous_day': previous_day.isoformat() if previous_day else None,
+            'products': result[0]['count']
+        }
+        self.logger.info(f'Stock snapshot taken: {report}')
+        return report
+
+    def get_stock_at(self, day: date, product_ids: Iterable[int] = None) -> dict:
+        """
+        Get the stock at the end of `day` from the latest snapshot before it plus the
+        movements since, for the given products or every moved product
+
+        :return: Mapping of product id to its stock quantity
+        """
+        params = {'day': day}
+        product_filter = ''
+        if product_ids is not None:
+            params['product_ids'] = list(product_ids)
+            product_filter = 'AND product_id = ANY(:product_ids)'
+
+        rows = self.repo.execute(f"""
+            WITH snapshot AS (
+                SELECT COALESCE(MAX(day), '-infinity') AS day FROM stock_snapshot WHERE day <= :day
+            )
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM (
+                SELECT product_id, quantity FROM stock_snapshot
+                WHERE day = (SELECT day FROM snapshot) {product_filter}
+                UNION ALL
+                SELECT product_id, quantity FROM stock_movement
+                WHERE moved_at > (SELECT day FROM snapshot) AND moved_at <= :day {product_filter}
+            ) m
+            GROUP BY product_id
+            ORDER BY product_id
+        """, params)
+        stock = dict.fromkeys(params.get('product_ids', []), 0)
+        stock.update({row['product_id']: int(row['quantity']) for row in rows})
+        return stock
+
+    def reconcile(self, fix: bool = False) -> dict:
+        """
+        Compare the stock quantity of every product against the sum of its movements in
+        one pass, optionally recording the differences as adjustments dated today
+
+        :param fix: Record an adjustment for every drifted product
+        :return: The number of checked products and the drifted ones
+        """
+        with UnitOfWork():
+            result = self.repo.execute("""
+                SELECT
+                    COUNT(*) AS products,
+                    COALESCE(JSON_AGG(JSON_BUILD_OBJECT(
+                        'product_id', p.id,
+                        'stock_quantity', p.stock_quantity,
+                        'ledger_quantity', COALESCE(m.quantity, 0)
+                    ) ORDER BY p.id) FILTER (WHERE p.stock_quantity <> COALESCE(m.quantity, 0)), '[]')
+                    AS drifted
+                FROM product p
+                LEFT JOIN (
+                    SELECT product_id, SUM(quantity) AS quantity FROM stock_movement GROUP BY product_id
+                ) m ON m.product_id = p.id
+            """)[0]
+            drifted = result['drifted']
+            if fix:
+                self.record_adjustments({
+                    product['product_id']: product['stock_quantity'] - product['ledger_quantity']
+                    for product in drifted
+                })
+
+        report = {'products': result['products'], 'drifted': drifted, 'fixed': fix and bool(drifted)}
+        if drifted:
+            self.logger.warning(f'Stock of {len(drifted)} products drifted from the ledger')
+        return report
@@ -1,8 +1,28 @@
+from collections import namedtuple
+
+from flask_login import UserMixin
 from sqlalchemy import func
 
+from src.default import USER_CACHE_SIZE, USER_CACHE_TTL
+from src.helpers.cache import TTLCache
 from src.models import User, Product, Importer, Order
 from src.services import BaseService
 
+user_cache = TTLCache('users', maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+class SessionUser(namedtuple('SessionUser', ('id', 'username', 'is_active')), UserMixin):
+    """Identity of a logged-in user, as kept in `user_cache`.
+
+    A tuple of plain values rather than the mapped `User`, so one instance can be shared
+    by concurrent requests without any session or ORM state.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_user(cls, user: User) -> 'SessionUser':
+        return cls(user.id, user.username, True)
+
 
 class UserService(BaseService):
     def __init__(self):
@@ -12,7 +32,29 @@ class UserService(BaseService):
         self.logger.info(f'Creating user {username}')
         user = User(username=username.lower())
         user.set_password(password)
-        return self.repo.insert(user)
+        user = self.repo.insert(user)
+        self.repo.after_commit(lambda: user_cache.invalidate(user.id))
+        return user
+
+    def get_cached_user(self, user_id) -> SessionUser:
+        """Get the identity of a user from the process-local cache, querying the database
+        only on a miss.
+
+        Used to load the session user on every authenticated request; an id that is not
+        a number, e.g. from a tampered session, gives `None` like an unknown user.
+        """
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        if user := user_cache.get(user_id):
+            return user
+
+        if user := self.get_user_by_id(user_id):
+            user = SessionUser.from_user(user)
+            user_cache.set(user_id, user)
+        return user
 
     def get_user_by_id(self, user_id: int) -> User:
         self.logger.info(f'Getting user {user_id}')